@@ -1,4 +1,5 @@
 import ast
+import bisect
 import logging
 
 from util import disjoint_sum, cname
@@ -126,6 +127,110 @@ def _get_last_lineno(self):
 ast.stmt.last_lineno = _get_last_lineno
 
 
+class SpanIndex(object):
+    """
+    The line spans of all statements in an AST module, computed in one pass,
+    for looking up a statement's last line without walking down to it, or the
+    statement at a line.
+
+    A statement's span runs from its line number to its last line number, as
+    defined by `last_lineno` (so the span of a `try` statement doesn't cover
+    its exception handlers), except that statements `last_lineno` doesn't know
+    of (such as expression statements) span just their line. Statements
+    (including any `TypeDec`s) are kept in source order, which is also
+    pre-order, in parallel tables.
+
+    #### Instance variables
+    - `stmts`: list of every statement in the module, in source order.
+    - `first`: list of the first line of each statement in `stmts`.
+    - `last`: list of the last line of each statement in `stmts`.
+    - `parent`: list of the index in `stmts` of the statement containing each
+        statement, or -1 for a statement directly in the module.
+    """
+
+    def __init__(self, mod):
+        self.stmts = []
+        self.first = []
+        self.parent = []
+
+        # Position of each statement in `stmts`.
+        self._index = {}
+
+        stack = [(stmt, -1) for stmt in reversed(mod.body)]
+
+        while stack:
+            (stmt, parent) = stack.pop()
+            i = len(self.stmts)
+
+            self._index[stmt] = i
+            self.stmts.append(stmt)
+            self.first.append(stmt.lineno)
+            self.parent.append(parent)
+
+            for stmt_list in reversed(_child_stmt_lists(stmt)):
+                stack.extend((child, i) for child in reversed(stmt_list))
+
+        # Every statement comes after the statements containing it, so going
+        # backwards visits statements in post-order.
+        self.last = list(self.first)
+
+        for i in reversed(xrange(len(self.stmts))):
+            stmt = self.stmts[i]
+            if stmt.is_compound():
+                self.last[i] = self.last[self._index[_last_child(stmt)]]
+
+    def span(self, stmt):
+        """Return the `(first line, last line)` of statement `stmt`."""
+
+        i = self._index[stmt]
+        return (self.first[i], self.last[i])
+
+    def last_lineno(self, stmt):
+        """Return the last line number of statement `stmt`."""
+
+        return self.last[self._index[stmt]]
+
+    def stmt_at(self, lineno):
+        """
+        Return the innermost statement whose span includes line `lineno`, or
+        `None` if there is none.
+        """
+
+        # The last statement starting at or before the line is inside the
+        # statement we want, if there is one.
+        i = bisect.bisect_right(self.first, lineno) - 1
+
+        while i >= 0 and self.last[i] < lineno:
+            i = self.parent[i]
+
+        return self.stmts[i] if i >= 0 else None
+
+def _child_stmt_lists(stmt):
+    """
+    Return the statement lists directly in statement `stmt`, in source order:
+    those of `stmt_lists`, plus the bodies of any exception handlers.
+    """
+
+    if not stmt.is_compound():
+        return ()
+    elif stmt.__class__ is ast.TryExcept:
+        return ([stmt.body] + [h.body for h in stmt.handlers] + [stmt.orelse])
+    else:
+        return stmt.stmt_lists()
+
+def _last_child(stmt):
+    """
+    Return the statement whose last line is the last line of the compound
+    statement `stmt`, following `last_lineno`.
+    """
+
+    branches = stmt.stmt_lists()
+    body = branches[-1] if branches[-1] else branches[0]
+
+    assert body, "Compound statement with empty body shouldn't parse"
+    return body[-1]
+
+
 ## TypeDec class and methods to insert TypeDecs into an AST
 
 class TypeStore():
@@ -203,172 +308,243 @@ class TypeDec(ast.stmt):
         `mod`.
         """
 
-        self._place_in_stmt_list(mod.body)
+        place_typedecs(mod, [self])
 
-    def _place_in_stmt_list(self, stmt_list):
-        """
-        Place this `TypeDec` instance in its proper place in AST statement node
-        list `stmt_list`.
-
-        NOTE: This all assumes that no blocks have a typedec as a last
-        statement. If so, the typedec will probably be inserted after the block
-        (or in the next part of the block). For determining whether a typedec is
-        at the end of a block or after it, we can compare columns, but there is
-        no way to tell whether a typedec is at the end of a block or at the
-        beginning of an adjacent block (ie, body vs orelse blocks).
-        """
+def place_typedecs(mod, typedecs):
+    """
+    Place each `TypeDec` in the list `typedecs` in its proper place in AST
+    module node `mod`, in a single pass over the module, by inserting them in
+    its statement lists. (A `TypeDecTable` finds the same places without
+    modifying `mod`.)
+    """
 
-        # For each index and corresponding statement in `stmt_list`
-        for (i, stmt) in zip(range(len(stmt_list)), stmt_list):
+    table = TypeDecTable(mod, typedecs)
 
-            # Place `self` if we've gone past the desired lineno or hit the end
-            # of the list. Note: one of these will always be reached eventually.
+    for stmt_list in table.stmt_lists():
+        stmt_list[:] = table.merged(stmt_list)
 
-            if stmt.lineno > self.lineno:
 
-                # If the desired lineno is past the previous statement's last
-                # lineno, then just put `self` before the next statement;
-                # otherwise, put `self` inside the previous statement.
+class TypeDecTable(object):
+    """
+    The places of `TypeDec`s in an AST module, kept in a table beside the
+    module rather than inserted into it, so that the module is not modified
+    and can be given other tables.
+
+    The places are the same as placing the typedecs one at a time, in the
+    order given: in each statement list, typedecs come in order of line
+    number, and typedecs on the same line in the reverse of their order in
+    `typedecs`.
+    """
 
-                if i == 0 or self.lineno > stmt_list[i-1].last_lineno():
-                    stmt_list.insert(i, self)
-                    return
-                else: # self.lineno < stmt_list[i-1].last_lineno()
-                    self._place_in_compound_stmt(stmt_list[i-1])
-                    return
+    def __init__(self, mod, typedecs):
+        """
+        Find the places of the `TypeDec`s in the list `typedecs` in AST module
+        node `mod`.
+        """
 
-            elif stmt.lineno == self.lineno:
+        # Map from the id of each statement list with typedecs to the list and
+        # a dictionary from positions in it to the typedecs to put there.
+        self._places = {}
 
-                # We've hit a statement with the same line number as the type
-                # declaration. This corresponds to cases like this:
-                #   x = 5 #: x : int
-                # We allow this even for compound statements because this could
-                # be handy:
-                #   for x in y: #: x : int
+        # Sort by line, reversing typedecs on the same line.
+        order = sorted(range(len(typedecs)),
+                       key=lambda i: (typedecs[i].lineno, -i))
 
-                stmt_list.insert(i, self)
-                return
+        if order:
+            _place_in_stmt_list(mod.body, [typedecs[i] for i in order],
+                                SpanIndex(mod), self._places)
 
-            elif i == len(stmt_list) - 1:
+    def stmt_lists(self):
+        """Return a list of the statement lists which have typedecs."""
 
-                # The desired lineno is past the last statement, so either it's
-                # in the last statement or after it.
+        return [stmt_list for (stmt_list, places) in self._places.values()]
 
-                if self.lineno > stmt.last_lineno():
-                    stmt_list.insert(i+1, self)
-                    return
-                else: # self.lineno < stmt.last_lineno()
-                    self._place_in_compound_stmt(stmt)
-                    return
+    def places(self, stmt_list):
+        """
+        Return a dictionary from each position in statement list `stmt_list`
+        to the list of typedecs to put before the statement there (or after
+        the last one, for the position `len(stmt_list)`), which is empty if
+        there are none.
+        """
 
+        entry = self._places.get(id(stmt_list))
+        return entry[1] if entry else {}
 
-    def _place_in_compound_stmt(self, stmt):
+    def merged(self, stmt_list):
         """
-        Place this `TypeDec` instance in its proper place within the AST
-        compound statement node `stmt`.
-
-        Pre-condition: `stmt.is_compound()`
-        Pre-condition: `stmt.lineno < self.lineno < stmt.last_lineno()`
-
-        NOTE: This all assumes that no blocks have a typedec as a last
-        statement. If so, the typedec will probably be inserted after the block
-        (or in the next part of the block). For determining whether a typedec is
-        at the end of a block or after it, we can compare columns, but there is
-        no way to tell whether a typedec is at the end of a block or at the
-        beginning of an adjacent block (ie, body vs orelse blocks).
+        Return a list of the statements in `stmt_list` with its typedecs in
+        their places, or `stmt_list` itself if it has none.
         """
 
-        # Assert pre-conditions.
-        assert stmt.is_compound()
-        assert stmt.lineno < self.lineno < stmt.last_lineno(), \
-            str(stmt.lineno) + " < " + str(self.lineno) + " < " + \
-            str(stmt.last_lineno())
+        entry = self._places.get(id(stmt_list))
+        if entry is None:
+            return stmt_list
 
+        places = entry[1]
+        new_list = []
 
-        branches = stmt.stmt_lists()
+        for (i, stmt) in enumerate(stmt_list):
+            if i in places:
+                new_list.extend(places[i])
+            new_list.append(stmt)
 
-        if len(branches) == 1:
+        new_list.extend(places.get(len(stmt_list), ()))
+        return new_list
 
-            # Compound statemnet with only one branch.
-            body = branches[0]
+def _place_in_stmt_list(stmt_list, typedecs, spans, places):
+    """
+    Find the proper places of the `TypeDec`s in `typedecs`, which are sorted by
+    line number, in AST statement node list `stmt_list` (or in its compound
+    statements), and record them in `places`, as in `TypeDecTable`. `spans` is
+    the module's `SpanIndex`.
+
+    NOTE: This all assumes that no blocks have a typedec as a last statement.
+    If so, the typedec will probably be inserted after the block (or in the
+    next part of the block). For determining whether a typedec is at the end of
+    a block or after it, we can compare columns, but there is no way to tell
+    whether a typedec is at the end of a block or at the beginning of an
+    adjacent block (ie, body vs orelse blocks).
+    """
 
-            self._place_in_stmt_list(body)
+    # Nothing can be placed in an empty list, and the typedecs are dropped.
+    if not stmt_list:
+        return
 
-        else: # len(branches) == 2
+    n = len(stmt_list)
 
-            # Compound statement with two branches.
-            body1 = branches[0]
-            body2 = branches[1]
+    # `before[i]` are the typedecs to put before `stmt_list[i]` (or after the
+    # last statement, if `i == n`), and `inside[i]` those to put inside it.
+    before = [[] for i in range(n + 1)]
+    inside = [[] for i in range(n)]
 
-            if len(body1) == 0:
-                body1_last = stmt.lineno
-            else:
-                body1_last = body1[-1].lineno
+    i = 0
+
+    for tdec in typedecs:
+
+        # Move to the first statement at or past the typedec's line, or the
+        # end of the list.
+        while i < n and stmt_list[i].lineno < tdec.lineno:
+            i += 1
+
+        if i < n and stmt_list[i].lineno == tdec.lineno:
+
+            # We've hit a statement with the same line number as the type
+            # declaration. This corresponds to cases like this:
+            #   x = 5 #: x : int
+            # We allow this even for compound statements because this could
+            # be handy:
+            #   for x in y: #: x : int
+            before[i].append(tdec)
+
+        elif i == 0:
+            before[i].append(tdec)
 
-            if self.lineno < body1_last:
-                self._place_in_stmt_list(body1)
+        else:
+
+            # If the desired lineno is past the previous statement's last
+            # lineno, then just put the typedec before the next statement (or
+            # at the end); otherwise, put it inside the previous statement.
+            if tdec.lineno > spans.last_lineno(stmt_list[i-1]):
+                before[i].append(tdec)
             else:
-                self._place_in_stmt_list(body2)
+                inside[i-1].append(tdec)
+
+    places[id(stmt_list)] = (stmt_list, dict((i, tdecs) for (i, tdecs)
+                                             in enumerate(before) if tdecs))
+
+    for (i, stmt) in enumerate(stmt_list):
+        if inside[i]:
+            _place_in_compound_stmt(stmt, inside[i], spans, places)
+
+def _place_in_compound_stmt(stmt, typedecs, spans, places):
+    """
+    Find the proper places of the `TypeDec`s in `typedecs`, which are sorted
+    by line number, within the AST compound statement node `stmt`, given the
+    module's `SpanIndex` `spans`, and record them in `places`.
+
+    Pre-condition: `stmt.is_compound()`
+    Pre-condition: `stmt.lineno < tdec.lineno < stmt.last_lineno()` for each
+        `tdec` in `typedecs`
+
+    NOTE: This all assumes that no blocks have a typedec as a last statement.
+    If so, the typedec will probably be inserted after the block (or in the
+    next part of the block). For determining whether a typedec is at the end of
+    a block or after it, we can compare columns, but there is no way to tell
+    whether a typedec is at the end of a block or at the beginning of an
+    adjacent block (ie, body vs orelse blocks).
+    """
+
+    # Assert pre-conditions.
+    assert stmt.is_compound()
+    last_lineno = spans.last_lineno(stmt)
+    for tdec in typedecs:
+        assert stmt.lineno < tdec.lineno < last_lineno, \
+            str(stmt.lineno) + " < " + str(tdec.lineno) + " < " + \
+            str(last_lineno)
+
+    branches = stmt.stmt_lists()
+
+    if len(branches) == 1:
+
+        # Compound statemnet with only one branch.
+        body = branches[0]
+
+        _place_in_stmt_list(body, typedecs, spans, places)
+
+    else: # len(branches) == 2
+
+        # Compound statement with two branches.
+        body1 = branches[0]
+        body2 = branches[1]
+
+        if len(body1) == 0:
+            body1_last = stmt.lineno
+        else:
+            body1_last = body1[-1].lineno
+
+        tdecs1 = [tdec for tdec in typedecs if tdec.lineno < body1_last]
+        tdecs2 = typedecs[len(tdecs1):]
+
+        if tdecs1:
+            _place_in_stmt_list(body1, tdecs1, spans, places)
+        if tdecs2:
+            _place_in_stmt_list(body2, tdecs2, spans, places)
 
 class TypeDecASTModule:
     """
-    A wrapper for an `ast.Module` which has the property that all of its
-    children nodes have been populated with additional nodes (not specified in
-    the standard AST library) to represent Pyty type declarations.
+    A typed view of an `ast.Module`: the module along with Pyty type
+    declarations, whose places in it are kept in a `TypeDecTable` rather than
+    by inserting `TypeDec` nodes (which are not specified in the standard AST
+    library). The module is not modified, so any number of views, with
+    different declarations, can share it.
 
     #### Instance variables
-    - `tree`: the `ast.Module` AST wrapped, which has been modified to include
-        `TypeDec` nodes in proper locations.
-    - `typedecs`: list of `TypeDec` nodes which have been added to this AST.
-    - `clone`: whether `tree` was created by directly modifying a provided
-        untyped AST or if a copy was modified.
-    - `original_tree`: (only exists if `clone` is `True`) the untyped AST which
-        was populated wiht `TypeDec`s.
+    - `tree`: the `ast.Module` AST, as given.
+    - `typedecs`: list of `TypeDec` nodes declared in this view.
+    - `table`: the `TypeDecTable` of the places of `typedecs` in `tree`.
     """
 
-    def __init__(self, untyped_tree, typedecs, clone=False):
+    def __init__(self, untyped_tree, typedecs):
         """
         Create `TypeDecASTModule` from an AST that has no type declarations and
-        a list of type declarations to add. Can insert the `TypeDec` nodes into
-        the provided tree, or into a clone of the provided tree.
+        a list of type declarations to add.
 
         #### Parameters:
         - `untyped_tree`: the `ast.Module` AST without any type declarations.
         - `typedecs`: list of `TypeDec` nodes to add to `untyped_tree`.
-        - `clone`: whether to modify `untyped_tree` directly or instead operate
-            on a copy. Defaults to modifying `untyped_tree` directly.
         """
 
-        if clone:
-            self.original_tree = untyped_tree
-            self.tree = copy.deepcopy(untyped_tree)
-        else:
-            self.tree = untyped_tree
-
-        self.clone = clone
+        self.tree = untyped_tree
         self.typedecs = typedecs
-
-        # place each type declaration
-        for typedec in typedecs:
-            self.place_typedec(typedec)
+        self.table = TypeDecTable(untyped_tree, typedecs)
 
     def __str__(self):
         return "Tree:\n" + str(self.tree) + "\nTypedecs:\n" + str(self.typedecs)
 
-    def get_original_tree(self):
-        """
-        Return the original tree if this `TypeDecAST` was initializeda s a copy
-        (with the `clone` field), and returns `None` otherwise.
-        """
-
-        if clone:
-            return self.original_tree
-        else:
-            return None
-
     def place_typedec(self, typedec):
         """
-        Place the specified `TypeDec` in this `TypeDecASTModule`.
+        Add the specified `TypeDec` to this `TypeDecASTModule`.
         """
 
-        typedec.place_in_module(self.tree)
+        self.typedecs = self.typedecs + [typedec]
+        self.table = TypeDecTable(self.tree, self.typedecs)
@@ -1,21 +1,30 @@
 import ast
 import logging
+from collections import namedtuple
 
-from util import cname, slice_range, node_is_int, node_is_None, valid_int_slice
-from errors import TypeUnspecifiedError, ASTTraversalError
+from util import (cname, slice_range, node_is_int, node_is_None,
+                  ast_node_classes, MemoTable)
+from errors import (TypeUnspecifiedError, TypeMultiSpecifiedError,
+                    ASTTraversalError)
 from ptype import PType
 from settings import DEBUG_TYPECHECK
 from logger import Logger
 from ast_extensions import TypeDec
-from infer import infer_expr, env_get
+from infer import infer_expr, env_get, infer_memo
+from unify import Substitution
+from env import Env, as_env
+
+# Need to use this form to resolve circular import.
+import engine
 
 log = None
 
 def t_debug(s, cond=True):
-    log.debug(s, DEBUG_TYPECHECK and cond)
+    if log is not None:
+        log.debug(s, DEBUG_TYPECHECK and cond)
 
 def call_function(fun_name, *args, **kwargs):
-    return globals()[fun_name](*args, **kwargs)
+    return engine.run_rule(globals()[fun_name](*args, **kwargs))
 
 int_t = PType.int()
 float_t = PType.float()
@@ -41,112 +50,207 @@ comp_ops = comp_num_ops | comp_eq_ops
 
 ## Module Typechecking.
 
-def check_mod(mod):
+def check_mod(mod, cache=None):
     """
-    Check whether the module node `mod` typechecks under its embedded
-    environments.
+    Check whether the module `mod` typechecks under its embedded environments.
+    `mod` is either an `ast_extensions.TypeDecASTModule`, whose declarations
+    are kept beside its module node, or a module node with `TypeDec`s in its
+    statement lists.
+
+    The module is first compiled into a flat list of checking obligations (see
+    `engine.compile_module`), which are then discharged in order. If `cache` is
+    a `func_cache.FunctionCache`, top-level function definitions it records as
+    typechecking are not checked again.
     """
 
     t_debug("----- v Typechecking module v -----")
 
-    if mod.__class__ != ast.Module:
+    if getattr(mod, 'tree', mod).__class__ != ast.Module:
         t_debug("Returning false because this isn't a module")
         t_debug("----- ^ Typechecking module ^ -----")
         return False
 
-    result = check_stmt_list(mod.body, {})
+    clear_memos()
+    try:
+        result = engine.run(engine.compile_module(mod), cache)
+    finally:
+        clear_memos()
+
     t_debug("return: " + str(result) + "\n----- ^ Typechecking module ^ -----")
     return result
 
+def diagnose_mod(mod, cache=None):
+    """
+    Typecheck the module `mod` like `check_mod` (using `cache` likewise),
+    but without stopping at the first statement that fails, and return a list
+    of `engine.Diagnostic`s describing each failure. The list is empty if the
+    module typechecks.
+    """
+
+    tree = getattr(mod, 'tree', mod)
+    assert tree.__class__ is ast.Module, "%s is not a module" % cname(tree)
+
+    clear_memos()
+    try:
+        return engine.collect(engine.compile_module(mod), cache)
+    finally:
+        clear_memos()
+
+
+
+
+## Goals.
+
+# Kinds of goals. A goal asks whether a statement (`STMT`), an expression
+# against a type (`EXPR`), or a statement list (`STMTS`) typechecks under an
+# environment, or whether a type declaration (`DECL`) is consistent with the
+# declarations already in an environment.
+STMT = "stmt"
+EXPR = "expr"
+STMTS = "stmts"
+DECL = "decl"
+
+"""
+A goal to be discharged by the engine. `node` is the AST node (or, for `STMTS`
+goals, the list of statements) and `t` the expected type, which is `None` for
+statements and statement lists. `table` is the `ast_extensions.TypeDecTable`
+placing the type declarations of the statements (if they are kept beside the
+module rather than in its statement lists), and `None` for other goals. The
+engine gives the statement goals that a rule yields the table of the rule's
+own goal.
+"""
+Goal = namedtuple('Goal', ['kind', 'node', 't', 'env', 'table'])
+
+def stmt_goal(stmt, env, table=None):
+    return Goal(STMT, stmt, None, env, table)
+
+def expr_goal(expr, t, env):
+    return Goal(EXPR, expr, t, env, None)
+
+def stmts_goal(stmts, env, table=None):
+    return Goal(STMTS, stmts, None, env, table)
+
+def decl_goal(tdec, env):
+    return Goal(DECL, tdec, tdec.t, env, None)
+
+"""
+The rules below are generators: a rule yields each goal it depends on, is sent
+back that goal's result, and finally yields its own result. Written this way,
+they are run by `engine.discharge` with an explicit stack instead of recursing
+into each other. Rules that need no subgoals may be plain functions.
+"""
+
 
 
 
 ## Statement List Typechecking.
 
-def check_stmt_list(stmts, env):
+def check_stmt_list(stmts, env, table=None):
     """
     Check whether each stmt in `stmts` typechecks correctly. `env` is the
-    common type environment shared by all stmts in `stmts`
+    common type environment shared by all stmts in `stmts`, and `table` the
+    `ast_extensions.TypeDecTable` of their type declarations, if any.
     """
 
-    # (Stmts-Base) assignment rule.
-    if not stmts:
-        return True
+    return engine.discharge(stmts_goal(stmts, env, table))
 
-    # (Stmts) assignment rule.
-    elif stmts[0].__class__ is not TypeDec:
-        return check_stmt(stmts[0], env) and check_stmt_list(stmts[1:], env)
-
-    # (Stmts-LetA) assignment rule.
-    elif (stmts[1].__class__ is ast.Assign and
-          len(stmts[0].targets) == 1 and len(stmts[1].targets) == 1 and
-          stmts[0].targets[0].__class__ is ast.Name and
-          stmts[1].targets[0].__class__ is ast.Name and
-          stmts[0].targets[0].id == stmts[1].targets[0].id):
-        tdec = stmts[0]
-        tar_id = tdec.targets[0].id
-        assmt = stmts[1]
-
-        # Throw an error if the typedec target has already been declared with a
-        # different type.
-        try:
-            tar_t = env_get(env, tar_id)
-            if tar_t != tedc.t:
-                raise TypeMultiSpecifiedError()
-        except TypeUnspecifiedError:
-            pass
+def lower_stmt_list(stmts, env, table=None):
+    """
+    Return the list of goals which must all succeed, in order, for the stmts in
+    `stmts`, along with their type declarations in `table` (a
+    `ast_extensions.TypeDecTable`, if any), to typecheck under `env`.
+
+    The Stmts rules are applied front to back: each rule covers the first one
+    or two statements of the remaining list and then continues with the rest of
+    the list under a possibly extended environment. The environments depend
+    only on the type declarations, so they are all known up front.
+    """
 
-        new_env = dict(env)
-        new_env[tar_id] = tdec.t.quantify()
+    if table is not None:
+        stmts = table.merged(stmts)
 
-        return (check_expr(assmt.value, tdec.t, env) and
-                check_stmt_list(stmts[2:], new_env))        
+    env = as_env(env)
+    goals = []
+    i = 0
+    n = len(stmts)
 
-    # (Stmts-LetF) assignment rule.
-    elif (stmts[1].__class__ is ast.FunctionDef and
-          len(stmts[0].targets) == 1 and stmts[0].t.is_arrow() and
-          stmts[0].targets[0].id == stmts[1].name):
-        tdec = stmts[0]
-        tar_id = tdec.targets[0].id
-        fndef = stmts[1]
+    while i < n:
+        stmt = stmts[i]
+        nxt = stmts[i+1] if i + 1 < n else None
 
-        # Throw an error if the typedec target has already been declared with a
-        # different type.
-        try:
-            tar_t = env_get(env, tar_id)
-            if tar_t != tdec.t:
-                raise TypeMultiSpecifiedError()
-        except TypeUnspecifiedError:
-            pass
+        # (Stmts) assignment rule.
+        if stmt.__class__ is not TypeDec:
+            goals.append(stmt_goal(stmt, env, table))
+            i += 1
 
-        env1, env2 = dict(env), dict(env)
-        env1[tar_id] = tdec.t
-        env2[tar_id] = tdec.t.quantify()
+        # (Stmts-LetA) assignment rule.
+        elif (nxt.__class__ is ast.Assign and
+              len(stmt.targets) == 1 and len(nxt.targets) == 1 and
+              stmt.targets[0].__class__ is ast.Name and
+              nxt.targets[0].__class__ is ast.Name and
+              stmt.targets[0].id == nxt.targets[0].id):
+            tdec = stmt
+            tar_id = tdec.targets[0].id
+            assmt = nxt
 
-        return check_stmt(fndef, env1) and check_stmt_list(stmts[2:], env2)
+            goals.append(decl_goal(tdec, env))
+            goals.append(expr_goal(assmt.value, tdec.t, env))
 
-    # (StmtsT) assignment rule.
-    else:
-        tdec = stmts[0]
+            env = env.extend(tar_id, tdec.t.quantify())
+            i += 2
 
-        # Throw an error if a typedec target has already been declared with a
-        # different type.
-        for tar in tdec.targets:
-            try:
-                tar_t = env_get(env, tar.id)
-                if tar_t != tdec.t:
-                    raise TypeMultiSpecifiedError()
-            except TypeUnspecifiedError:
-                pass
+        # (Stmts-LetF) assignment rule.
+        elif (nxt.__class__ is ast.FunctionDef and
+              len(stmt.targets) == 1 and stmt.t.is_arrow() and
+              stmt.targets[0].id == nxt.name):
+            tdec = stmt
+            tar_id = tdec.targets[0].id
+            fndef = nxt
 
-        new_env = dict(env)
-        for tar in tdec.targets:
-            new_env[tar.id] = tdec.t
+            goals.append(decl_goal(tdec, env))
+            goals.append(stmt_goal(fndef, env.extend(tar_id, tdec.t),
+                                   table))
 
-        return check_stmt_list(stmts[1:], new_env)
+            env = env.extend(tar_id, tdec.t.quantify())
+            i += 2
 
-    # No assignment rule found.
-    return False
+        # (StmtsT) assignment rule.
+        else:
+            tdec = stmt
+
+            goals.append(decl_goal(tdec, env))
+
+            env = env.extend_all((tar.id, tdec.t) for tar in tdec.targets)
+            i += 1
+
+    return goals
+
+def _check_stmt_list(stmts, env, table=None):
+    """Rule for `STMTS` goals."""
+
+    for goal in lower_stmt_list(stmts, env, table):
+        if not (yield goal):
+            yield False
+            return
+
+    # (Stmts-Base) assignment rule.
+    yield True
+
+def _check_declaration(tdec, env):
+    """
+    Rule for `DECL` goals. Throw an error if any identifier declared by `tdec`
+    has already been declared in `env` with a type other than `tdec.t`.
+    """
+
+    for tar in tdec.targets:
+        try:
+            tar_t = env_get(env, tar.id)
+            if tar_t != tdec.t:
+                raise TypeMultiSpecifiedError()
+        except TypeUnspecifiedError:
+            pass
+
+    return True
 
 
 
@@ -154,30 +258,18 @@ def check_stmt_list(stmts, env):
 
 stmt_template = "_check_%s_stmt"
 
-def check_stmt(stmt, env):
+def check_stmt(stmt, env, table=None):
     """
-    Check whether the statement `stmt` typechecks under type environment `env`.
+    Check whether the statement `stmt` typechecks under type environment `env`,
+    with the type declarations in `table` (an `ast_extensions.TypeDecTable`),
+    if any.
 
     We defer to the specific `check_X_stmt` functions to determine which type
     assignemnt rule to try. Information about the structure of each AST node is
     contained in the thesis PDF.
     """
 
-    t_debug("--- v Typechecking " + stmt.__class__.__name__ + " stmt v ---"
-            "\nStmt: " + str(stmt) + "\nEnv: " + str(env))
-
-    n = stmt_template % stmt.__class__.__name__
-
-    # if we get a KeyError, then we're inspecting an AST node that is not in
-    # the subset of the language we're considering (note: the subset is
-    # defined as whatever there are check function definitions for).
-    try:
-        result = call_function(n, stmt, env)
-        t_debug("return: " + str(result) + "\n--- ^ Typechecking stmt ^ ---")
-        return result
-    except KeyError as e:
-        t_debug("Found a stmt not in the language subset. (" + str(e) + ")")
-        return False
+    return engine.discharge(stmt_goal(stmt, env, table))
 
 
 def _check_FunctionDef_stmt(stmt, env):
@@ -196,28 +288,36 @@ def _check_FunctionDef_stmt(stmt, env):
 
         f_t = env_get(env, f)
 
+        # Every Fn-Def rule needs an arrow type.
+        if not f_t.is_arrow():
+            yield False
+            return
+
         # (Fn-Def1) assignment rule.
         if not a.args:
-            new_env = dict(env.items() + [("return", f_t.ran)])
-            return check_stmt_list(b, new_env)
+            new_env = as_env(env).extend("return", f_t.ran)
+            yield (yield stmts_goal(b, new_env))
+            return
 
         # (Fn-Def2) assignment rule.
         elif len(a.args) == 1 and f_t.dom != unit_t:
             arg_id = a.args[0].id
-            new_env = dict(env.items() +
-                           [(arg_id, f_t.dom), ("return", f_t.ran)])
-            return check_stmt_list(b, new_env)
+            new_env = as_env(env).extend_all([(arg_id, f_t.dom),
+                                              ("return", f_t.ran)])
+            yield (yield stmts_goal(b, new_env))
+            return
 
         # (Fn-Def3) assignment rule.
         elif f_t.dom.is_tuple() and f_t.dom.tuple_len() == len(a.args):
             arg_ids = map(lambda x: x.id, a.args)
             arg_ts = f_t.dom.elts
-            new_env = dict(env.items() +
-                           zip(arg_ids, arg_ts) + [("return", f_t.ran)])
-            return check_stmt_list(b, new_env)
+            new_env = as_env(env).extend_all(zip(arg_ids, arg_ts) +
+                                             [("return", f_t.ran)])
+            yield (yield stmts_goal(b, new_env))
+            return
 
     # No assignment rule found.
-    return False
+    yield False
 
 def _check_Return_stmt(stmt, env):
     """Return Statement."""
@@ -229,15 +329,16 @@ def _check_Return_stmt(stmt, env):
     try:
         r_t = env_get(env, "return")
     except TypeUnspecifiedError:
-        return False
+        yield False
+        return
 
     # (RetU) assignment rule.
     if not e:
-        return r_t == unit_t
+        yield r_t == unit_t
 
     # (Ret) assignment rule.
     else:
-        return check_expr(e, r_t, env)
+        yield (yield expr_goal(e, r_t, env))
 
 def _check_Assign_stmt(stmt, env):
     """Assignment."""
@@ -249,19 +350,22 @@ def _check_Assign_stmt(stmt, env):
 
     # (Assmt) assignment rule.
     if tars:
-        def valid_tar(t):
-            if t.__class__ is ast.Subscript:
-                col_t = infer_expr(t.value, env)
+        for tar in tars:
+            if tar.__class__ is ast.Subscript:
+                col_t = infer_expr(tar.value, env)
                 sub_of_tup = col_t and col_t.is_tuple()
             else:
                 sub_of_tup = False
-            t_t = infer_expr(t, env)
-            return t_t and check_expr(v, t_t, env) and not sub_of_tup
-        return all(valid_tar(tar) for tar in tars)
+            t_t = infer_expr(tar, env)
+            if not (t_t and (yield expr_goal(v, t_t, env)) and
+                    not sub_of_tup):
+                yield False
+                return
+        yield True
 
     # No assignment rule found.
     else:
-        return False
+        yield False
 
 def _check_AugAssign_stmt(stmt, env):
     """Augmented Assignment."""
@@ -275,7 +379,7 @@ def _check_AugAssign_stmt(stmt, env):
     e0_t = infer_expr(e0, env)
 
     # (Aug-Assmt) assignment rule. -- restricted by type inference
-    return e0_t and check_expr(ast.BinOp(e0, op, e1), e0_t, env)
+    yield e0_t and (yield expr_goal(ast.BinOp(e0, op, e1), e0_t, env))
 
 def _check_Print_stmt(stmt, env):
     """Print Statement."""
@@ -305,8 +409,8 @@ def _check_For_stmt(stmt, env):
     x_t = infer_expr(x, env)
 
     # (For) assignment rule. -- restricted by type inference
-    return (x_t and check_expr(e, PType.list(x_t), env) and
-            check_stmt_list(b0, env) and check_stmt_list(b1, env))
+    yield (x_t and (yield expr_goal(e, PType.list(x_t), env)) and
+           (yield stmts_goal(b0, env)) and (yield stmts_goal(b1, env)))
 
 def _check_While_stmt(stmt, env):
     """While Loop."""
@@ -317,9 +421,9 @@ def _check_While_stmt(stmt, env):
     b0 = stmt.body
     b1 = stmt.orelse
 
-    return (check_expr(e, bool_t, env) and
-            check_stmt_list(b0, env) and
-            check_stmt_list(b1, env))
+    yield ((yield expr_goal(e, bool_t, env)) and
+           (yield stmts_goal(b0, env)) and
+           (yield stmts_goal(b1, env)))
 
 def _check_If_stmt(stmt, env):
     """Conditional Block."""
@@ -330,9 +434,9 @@ def _check_If_stmt(stmt, env):
     b0 = stmt.body
     b1 = stmt.orelse
 
-    return (check_expr(e, bool_t, env) and
-            check_stmt_list(b0, env) and
-            check_stmt_list(b1, env))
+    yield ((yield expr_goal(e, bool_t, env)) and
+           (yield stmts_goal(b0, env)) and
+           (yield stmts_goal(b1, env)))
 
 def _check_Expr_stmt(stmt, env):
     """Expression Statement."""
@@ -345,11 +449,17 @@ def _check_Expr_stmt(stmt, env):
     if e.__class__ is ast.Call and e.func.__class__ is ast.Name:
         f = e.func
         f_t = env_get(env, f.id)
-        return check_expr(e, f_t.ran, env)
+
+        # A polymorphic function's result can have any instance of its range.
+        if f_t.is_univ():
+            yield (yield _check_poly_Call(e, f_t, None, env))
+            return
+
+        yield (yield expr_goal(e, f_t.ran, env))
 
     # No assignment rule found.
     else:
-        return False
+        yield False
 
 def _check_Pass_stmt(stmt, env):
     """Pass Statement."""
@@ -378,6 +488,21 @@ def _check_Continue_stmt(stmt, env):
 
 expr_template = "_check_%s_expr"
 
+# Results of `check_expr` under `Env`s, keyed by (expr node, type, environment
+# version). Rules such as Ineqlty, Str-Rep and Tup-Cat backtrack and check the
+# same subexpressions repeatedly. An `Env` never changes and each one has its
+# own version, so an entry can't go stale while its node is alive. The table
+# keeps its nodes alive, so it only lasts for the outermost engine run (a whole
+# module, in `check_mod`, or a single `check_expr` call). The engine looks
+# results up and stores them.
+expr_memo = MemoTable()
+
+def clear_memos():
+    """Empty the memo tables of `check_expr` and `infer_expr`."""
+
+    expr_memo.clear()
+    infer_memo.clear()
+
 def check_expr(expr, t, env):
     """
     Check whether the expression `expr` can be assigned type `t` under type
@@ -393,21 +518,7 @@ def check_expr(expr, t, env):
     assert isinstance(t, PType), \
            "Should be checking against a PType, not a " + cname(t)
 
-    n = expr_template % expr.__class__.__name__
-
-    t_debug("-- v Typechecking expr as " + str(t) + " v --\nExpr: " +
-            str(expr) + "\nEnv: " + str(env))
-
-    # if we get a KeyError, then we're inspecting an AST node that is not in
-    # the subset of the language we're considering (note: the subset is
-    # defined as whtaever there are check function definitions for).
-    try:
-        result = call_function(n, expr, t, env)
-        t_debug("return: " + str(result) + "\n-- ^ Typechecking expr ^ --")
-        return result
-    except KeyError as e:
-        t_debug("Found an expr not in the language subset. (" + str(e) + ")")
-        return False
+    return engine.discharge(expr_goal(expr, t, env))
 
 
 def _check_BoolOp_expr(boolop, t, env):
@@ -421,7 +532,11 @@ def _check_BoolOp_expr(boolop, t, env):
     assert op.__class__ in bool_ops, "%s not in bool ops" % cname(op)
 
     # (BoolOp) assignment rule.
-    return all(check_expr(e, t, env) for e in es)
+    for e in es:
+        if not (yield expr_goal(e, t, env)):
+            yield False
+            return
+    yield True
 
 def _check_BinOp_expr(binop, t, env):
     """Binary Operations."""
@@ -439,37 +554,52 @@ def _check_BinOp_expr(binop, t, env):
 
         # (Arith) assignment rule.
         if op.__class__ in arith_ops:
-            return check_expr(e0, t, env) and check_expr(e1, t, env)
+            yield ((yield expr_goal(e0, t, env)) and
+                   (yield expr_goal(e1, t, env)))
+            return
 
         # (BitOp) assignment rule.
         elif op.__class__ in bit_ops and t == int_t:
-            return check_expr(e0, int_t, env) and check_expr(e1, int_t, env)
+            yield ((yield expr_goal(e0, int_t, env)) and
+                   (yield expr_goal(e1, int_t, env)))
+            return
 
     # String and List Operations.
     elif t == str_t or t == unicode_t or t.is_list():
 
         # (Str-Cat) assignment rule.
         if op.__class__ is ast.Add:
-            return check_expr(e0, t, env) and check_expr(e1, t, env)
+            yield ((yield expr_goal(e0, t, env)) and
+                   (yield expr_goal(e1, t, env)))
+            return
 
         # (Str-Rep) assignment rule.
         elif op.__class__ is ast.Mult:
-            return any(check_expr(l, int_t, env) and check_expr(r, t, env) for
-                       (l, r) in [(e0, e1), (e1, e0)])
+            for (l, r) in [(e0, e1), (e1, e0)]:
+                if ((yield expr_goal(l, int_t, env)) and
+                    (yield expr_goal(r, t, env))):
+                    yield True
+                    return
+            yield False
+            return
 
         # (Str-Form) assignment rule.
         elif not t.is_list() and op.__class__ is ast.Mod:
-            return check_expr(e0, t, env)
+            yield (yield expr_goal(e0, t, env))
+            return
 
     # Tuple Operations.
     elif t.is_tuple():
 
         # (Tup-Cat) assignment rule.
         if op.__class__ is ast.Add:
-
-            return any(check_expr(e0, t.tuple_slice(0, m), env) and
-                       check_expr(e1, t.tuple_slice(m), env)
-                       for m in range(t.tuple_len()))
+            for m in _tup_cat_splits(e0, e1, t.tuple_len(), env):
+                if ((yield expr_goal(e0, t.tuple_slice(0, m), env)) and
+                    (yield expr_goal(e1, t.tuple_slice(m), env))):
+                    yield True
+                    return
+            yield False
+            return
 
         # (Tup-Rep) assignment rule.
         elif (op.__class__ is ast.Mult and
@@ -480,13 +610,49 @@ def _check_BinOp_expr(binop, t, env):
             e_len = int(t.tuple_len() / m)
             e_t = t.tuple_slice(0, e_len)
 
-            return (type(m) is int and t.tuple_len() % m == 0 and
-                    check_expr(e, e_t, env) and
-                    all(e_t == t.tuple_slice(e_len*i, e_len*(i+1))
-                        for i in range(1, m)))
+            yield (type(m) is int and t.tuple_len() % m == 0 and
+                   (yield expr_goal(e, e_t, env)) and
+                   all(e_t == t.tuple_slice(e_len*i, e_len*(i+1))
+                       for i in range(1, m)))
+            return
 
     # No assignment rule found.
-    return False
+    yield False
+
+def _tup_cat_splits(e0, e1, n, env):
+    """
+    Return the split points `m` at which Tup-Cat should check `e0 + e1`
+    against a tuple type `t` of length `n`, by checking `e0` against `t[:m]`
+    and `e1` against `t[m:]`. Every `m` in `range(n)` is a candidate, but if
+    either operand's length is known, at most one of them can succeed.
+    """
+
+    l0 = _tuple_len(e0, env)
+    if l0 is not None:
+        return [l0] if l0 < n else []
+
+    l1 = _tuple_len(e1, env)
+    if l1 is not None:
+        return [n - l1] if 0 < l1 <= n else []
+
+    return range(n)
+
+def _tuple_len(e, env):
+    """
+    Return the length of the tuple that expression `e` evaluates to, if it can
+    be read off the syntax of `e` or inferred, and `None` otherwise.
+    """
+
+    if e.__class__ is ast.Tuple:
+        return len(e.elts)
+
+    try:
+        e_t = infer_expr(e, env)
+    except TypeUnspecifiedError:
+        # Leave reporting the identifier to the rules that check `e`.
+        return None
+
+    return e_t.tuple_len() if e_t is not None and e_t.is_tuple() else None
 
 def _check_UnaryOp_expr(unop, t, env):
     """Unary Operations."""
@@ -500,19 +666,19 @@ def _check_UnaryOp_expr(unop, t, env):
 
     # (Inv) assignment rule.
     if op.__class__ is ast.Invert and t == int_t:
-        return check_expr(e, int_t, env)
+        yield (yield expr_goal(e, int_t, env))
 
     # (Uadd) assignment rule.
     elif op.__class__ in [ast.UAdd, ast.USub] and t in [int_t, float_t]:
-        return check_expr(e, t, env)
+        yield (yield expr_goal(e, t, env))
 
     # (Not) assignment rule.
     elif op.__class__ is ast.Not and t == bool_t:
-        return check_expr(e, bool_t, env)
+        yield (yield expr_goal(e, bool_t, env))
 
     # No assignment rule found.
     else:
-        return False
+        yield False
 
 def _check_Lambda_expr(lambd, t, env):
     """Abstraction."""
@@ -522,30 +688,30 @@ def _check_Lambda_expr(lambd, t, env):
     a = lambd.args
     e = lambd.body
 
-    # All Abs rules have specific forms for args.
-    if (all(arg.__class__ is ast.Name for arg in a.args) and
+    # All Abs rules have specific forms for args, and need an arrow type.
+    if (t.is_arrow() and all(arg.__class__ is ast.Name for arg in a.args) and
         a.vararg is None and a.kwarg is None and not a.defaults):
 
         # (Abs1) assignment rule.
         if not a.args:
-            return check_expr(e, t.ran, env)
+            yield (yield expr_goal(e, t.ran, env))
 
         # (Abs2) assignment rule.
         elif len(a.args) == 1 and t.dom != unit_t:
             arg_id = a.args[0].id
-            new_env = dict(env.items + [(arg_id, t.dom)])
-            return check_expr(e, t.ran, new_env)
+            new_env = as_env(env).extend(arg_id, t.dom)
+            yield (yield expr_goal(e, t.ran, new_env))
 
         # (Abs3) assignment rule.
         elif t.dom.is_tuple() and t.dom.tuple_len() == len(a.args):
             arg_ids = map(lambda x: x.id, a.args)
             arg_ts = t.dom.elts
-            new_env = dict(env.items() + zip(arg_ids, arg_ts))
-            return check_expr(e, t.ran, new_env)
+            new_env = as_env(env).extend_all(zip(arg_ids, arg_ts))
+            yield (yield expr_goal(e, t.ran, new_env))
 
     # No assignment rule found.
     else:
-        return False    
+        yield False
 
 def _check_IfExp_expr(ifx, t, env):
     """Conditional Expression."""
@@ -557,9 +723,9 @@ def _check_IfExp_expr(ifx, t, env):
     e2 = ifx.orelse
 
     # (If-Exp) assignment rule.
-    return (check_expr(e0, t, env) and
-            check_expr(e1, bool_t, env) and
-            check_expr(e2, t, env))
+    yield ((yield expr_goal(e0, t, env)) and
+           (yield expr_goal(e1, bool_t, env)) and
+           (yield expr_goal(e2, t, env)))
 
 def _check_Compare_expr(compare, t, env):
     """Comparisons."""
@@ -574,23 +740,28 @@ def _check_Compare_expr(compare, t, env):
 
     # (Eqlty) assigment rule.
     if len(ops) == 1 and ops[0].__class__ in comp_eq_ops and t == bool_t:
-        return True
+        yield True
 
     # (Ineqlty) assignment rule.
     elif len(ops) == 1 and ops[0].__class__ in comp_num_ops and t == bool_t:
         possible_ts = (int_t, float_t, str_t, unicode_t)
-        return any(check_expr(e0, pt, env) and check_expr(es[0], pt, env)
-                   for pt in possible_ts)
+        for pt in possible_ts:
+            if ((yield expr_goal(e0, pt, env)) and
+                (yield expr_goal(es[0], pt, env))):
+                yield True
+                return
+        yield False
 
     # (Comp-Chain) assignment rule.
     elif len(ops) > 1 and t == bool_t:
         head = ast.Compare(e0, ops[:1], es[:1])
         tail = ast.Compare(es[0], ops[1:], es[1:])
-        return check_expr(head, bool_t, env) and check_expr(tail, bool_t, env)
+        yield ((yield expr_goal(head, bool_t, env)) and
+               (yield expr_goal(tail, bool_t, env)))
 
     # No assignment rule found.
     else:
-        return False
+        yield False
 
 def _check_Call_expr(call, t, env):
     """Application."""
@@ -606,23 +777,71 @@ def _check_Call_expr(call, t, env):
     # All App rules have specific forms for keywords, starargs, and kwargs.
     if not k and not s and not kw:
 
+        # Applications of polymorphic functions instantiate the function's
+        # type to fit.
+        if (f.__class__ is ast.Name and f.id in env and
+            env_get(env, f.id).is_univ()):
+            yield (yield _check_poly_Call(call, env_get(env, f.id), t, env))
+            return
+
         # (App1) assignment rule.
         if not a:
-            return check_expr(f, PType.arrow(unit_t, t), env)
+            yield (yield expr_goal(f, PType.arrow(unit_t, t), env))
+            return
 
         # (App2) assignment rule.
         elif len(a) == 1 and f.__class__ is ast.Name:
             f_t = env_get(env, f.id)
-            return check_expr(a[0], f_t.dom, env) and f_t.ran == t
+            yield (yield expr_goal(a[0], f_t.dom, env)) and f_t.ran == t
+            return
 
         # (App3) assignment rule.
         elif f.__class__ is ast.Name:
             f_t = env_get(env, f.id)
             tup = ast.Tuple([b for b in a], ast.Load())
-            return check_expr(tup, f_t.dom, env) and f_t.ran == t
+            yield (yield expr_goal(tup, f_t.dom, env)) and f_t.ran == t
+            return
 
     # No assignment rule found.
-    return False
+    yield False
+
+def _check_poly_Call(call, f_t, t, env):
+    """
+    Application of a function whose type `f_t` is universally quantified, at
+    result type `t` (or at any result type, if `t` is `None`).
+
+    The quantified variables are instantiated with fresh variables, which are
+    solved by unifying the function's range with `t` and, if the domain is
+    still not fully determined, its domain with the argument's inferred type.
+    The argument is then checked against the solved domain as in App1-App3.
+    Callers yield this rule's generator to run it as a subgoal.
+    """
+
+    a = call.args
+
+    s = Substitution()
+    f_t = s.instantiate(f_t)
+
+    if not f_t.is_arrow() or (t is not None and not s.unify(f_t.ran, t)):
+        yield False
+        return
+
+    # (App1) assignment rule.
+    if not a:
+        yield s.unify(f_t.dom, unit_t)
+        return
+
+    # (App2) and (App3) assignment rules.
+    arg = a[0] if len(a) == 1 else ast.Tuple([b for b in a], ast.Load())
+
+    if s.has_flexible(f_t.dom):
+        arg_t = infer_expr(arg, env)
+
+        if not arg_t or not s.unify(f_t.dom, arg_t):
+            yield False
+            return
+
+    yield (yield expr_goal(arg, s.apply(f_t.dom), env))
 
 def _check_Num_expr(num, t, env):
     """Numeric Literals."""
@@ -666,7 +885,8 @@ def _check_Subscript_expr(subs, t, env):
     # opposite of syntax direction.
     c_t = infer_expr(c, env)
     if not c_t:
-        return False
+        yield False
+        return
 
     # Indexing.
     if s.__class__ is ast.Index:
@@ -675,16 +895,19 @@ def _check_Subscript_expr(subs, t, env):
 
         # (Str-Idx) assignment rule.
         if c_t == str_t or c_t == unicode_t:
-            return c_t == t and check_expr(e, int_t, env)
+            yield c_t == t and (yield expr_goal(e, int_t, env))
+            return
 
         # (Lst-Idx) assignment rule.
         elif c_t.is_list():
-            return t == c_t.elt and check_expr(e, int_t, env)
+            yield t == c_t.elt and (yield expr_goal(e, int_t, env))
+            return
 
         # (Tup-Idx) assignment rule.
         elif c_t.is_tuple():
             n = len(c_t.elts)
-            return node_is_int(e) and -n <= e.n < n and c_t.elts[e.n] == t
+            yield node_is_int(e) and -n <= e.n < n and c_t.elts[e.n] == t
+            return
 
     # Slicing.
     elif s.__class__ is ast.Slice:
@@ -692,19 +915,31 @@ def _check_Subscript_expr(subs, t, env):
 
         # (Flat-Slc) assignment rule.
         if c_t == str_t or c_t == unicode_t or c_t.is_list():
-            return c_t == t and valid_int_slice(e0, e1, e2, env)
+            yield c_t == t and (yield _valid_int_slice(e0, e1, e2, env))
+            return
 
         # (Tup-Slc) assignment rule.
         elif c_t.is_tuple() and ((not e0 or node_is_int(e0)) and
                                  (not e1 or node_is_int(e1)) and
                                  (not e2 or node_is_None(e2) or node_is_int(e2))):
             rng = slice_range(e0, e1, e2, c_t.tuple_len())
-            return (t.is_tuple() and rng and len(rng) == t.tuple_len()
-                    and all(c_t.elts[j] == t.elts[i]
-                            for (i,j) in enumerate(rng)))
+            yield (t.is_tuple() and rng and len(rng) == t.tuple_len()
+                   and all(c_t.elts[j] == t.elts[i]
+                           for (i,j) in enumerate(rng)))
+            return
 
     # No assignment rule found
-    return False
+    yield False
+
+def _valid_int_slice(l, u, s, env):
+    """
+    Rule form of `util.valid_int_slice`: determine whether the bounds and step
+    of a simple slice are valid integers (or Nones). Yielded as a subgoal.
+    """
+
+    yield ((l is None or (yield expr_goal(l, int_t, env))) and
+           (u is None or (yield expr_goal(u, int_t, env))) and
+           (s is None or node_is_None(s) or (yield expr_goal(s, int_t, env))))
 
 def _check_Name_expr(name, t, env):
     """Identifiers."""
@@ -736,10 +971,15 @@ def _check_List_expr(lst, t, env):
 
     # (Lst) assignment rule.
     if t.is_list():
-        return all(check_expr(e, t.elt, env) for e in es)
+        for e in es:
+            if not (yield expr_goal(e, t.elt, env)):
+                yield False
+                return
+        yield True
+        return
 
     # No assignment rule found.
-    return False
+    yield False
 
 def _check_Tuple_expr(tup, t, env):
     """Tuple Construction."""
@@ -750,7 +990,53 @@ def _check_Tuple_expr(tup, t, env):
 
     # (Tup) assignment rule.
     if t.is_tuple() and t.tuple_len() == len(es):
-        return all(check_expr(e, elt_t, env) for (e, elt_t) in zip(es, t.elts))
+        for (e, elt_t) in zip(es, t.elts):
+            if not (yield expr_goal(e, elt_t, env)):
+                yield False
+                return
+        yield True
+        return
 
     # No assignment rule found.
-    return False
+    yield False
+
+
+
+## Rule Dispatch.
+
+# Maps from AST node classes to the functions implementing their rules. Filled
+# in from the `_check_X_stmt` and `_check_X_expr` functions above when this
+# module is loaded; nodes of any other class are outside the language subset.
+stmt_rules = {}
+expr_rules = {}
+
+def register_stmt_rule(node_class, rule):
+    """
+    Check statements of AST node class `node_class` with `rule(stmt, env)`,
+    replacing any rule already registered for that class. This lets a plugin
+    extend the subset of the language that can be typechecked.
+    """
+
+    stmt_rules[node_class] = rule
+
+def register_expr_rule(node_class, rule):
+    """
+    Check expressions of AST node class `node_class` with `rule(expr, t, env)`,
+    replacing any rule already registered for that class.
+    """
+
+    expr_rules[node_class] = rule
+
+def _register_rules():
+    """Register the `_check_X_stmt` and `_check_X_expr` functions above."""
+
+    rules = globals()
+
+    for node_class in ast_node_classes():
+        name = node_class.__name__
+        if stmt_template % name in rules:
+            register_stmt_rule(node_class, rules[stmt_template % name])
+        if expr_template % name in rules:
+            register_expr_rule(node_class, rules[expr_template % name])
+
+_register_rules()
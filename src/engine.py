@@ -0,0 +1,481 @@
+import types
+from timeit import default_timer
+from collections import namedtuple
+
+import tracing
+from env import Env
+from errors import PytyError, TypeUnspecifiedError
+
+# Need to use this form to resolve circular import.
+import check
+
+"""
+Compilation of modules into flat lists of checking obligations, and the engine
+which discharges them.
+
+`compile_module` lowers a typed module's statement list into a `Program`: a
+table of the AST nodes to check, a table of type environments, and a list of
+obligations `(kind, node index, expected type, environment index)`, one per
+goal that the module's statements must satisfy (see `check.lower_stmt_list`).
+The obligations are independent of each other's results, so they can be
+scheduled separately; `run` discharges them in order and stops at the first
+one that fails, while `collect` carries on and describes every failure.
+
+`discharge` runs the typechecking rules for one goal. Rules are generators
+which yield the goals they depend on (see `check`), so instead of the rules
+calling each other, the engine keeps a stack of suspended rules, starts each
+goal a rule yields, and sends the goal's result back to the rule. Checking
+therefore uses no Python recursion, however deeply the AST is nested, except
+where type inference (which is not written as rules) checks subexpressions.
+
+The engine also consults and fills `check.expr_memo` for expression goals,
+and reports each statement and expression goal to `tracing` when it is
+enabled. The memo tables (`check.expr_memo` and `check.infer_memo`) last until
+the outermost `run`, `collect` or `discharge` returns.
+"""
+
+_GENERATOR = types.GeneratorType
+
+"""
+A typechecking failure found by `collect`:
+- `lineno`, `col_offset`: where the offending node starts, or `None` if the
+    node has no position.
+- `node`: the AST node class name.
+- `rule`: the name of the function implementing the rule that was tried, or
+    `None` if the node is outside the language subset.
+- `expected`: the PType the node was checked against (`None` for statements).
+- `inferred`: the PType inferred for the node, if it is an expression whose
+    type can be inferred, and otherwise `None`.
+- `message`: a description of the failure.
+"""
+Diagnostic = namedtuple('Diagnostic', ['lineno', 'col_offset', 'node', 'rule',
+                                       'expected', 'inferred', 'message'])
+
+_MISSING = object()
+
+
+class Program(object):
+    """
+    A module compiled into a flat list of checking obligations.
+
+    #### Instance variables
+    - `nodes`: the AST nodes the obligations are about, in the order first
+        needed. Obligations refer to nodes by their index in this list.
+    - `envs`: the type environments the obligations are checked under, which
+        obligations likewise refer to by index.
+    - `obligations`: list of `(kind, node index, expected type, env index)`
+        tuples. The module typechecks if and only if each one succeeds.
+    - `table`: the module's `ast_extensions.TypeDecTable`, which places its
+        type declarations in the statement lists the obligations check, or
+        `None` if they are in the lists themselves.
+    """
+
+    def __init__(self, nodes, envs, obligations, table=None):
+        self.nodes = nodes
+        self.envs = envs
+        self.obligations = obligations
+        self.table = table
+
+    def __len__(self):
+        return len(self.obligations)
+
+    def goal(self, i):
+        """Return obligation number `i` as a `check.Goal`."""
+
+        (kind, n, t, e) = self.obligations[i]
+        return check.Goal(kind, self.nodes[n], t, self.envs[e], self.table)
+
+def compile_module(mod):
+    """
+    Compile the typed module `mod` (a `TypeDecASTModule`, or an `ast.Module`
+    with `TypeDec`s in its statement lists) into a `Program`.
+    """
+
+    tree = getattr(mod, 'tree', mod)
+    table = getattr(mod, 'table', None)
+
+    nodes = []
+    envs = []
+    obligations = []
+
+    # Index of each node and environment already in `nodes` and `envs`.
+    node_index = {}
+    env_index = {}
+
+    for goal in check.lower_stmt_list(tree.body, Env(), table):
+        n = node_index.get(goal.node)
+        if n is None:
+            n = node_index[goal.node] = len(nodes)
+            nodes.append(goal.node)
+
+        e = env_index.get(goal.env.version)
+        if e is None:
+            e = env_index[goal.env.version] = len(envs)
+            envs.append(goal.env)
+
+        obligations.append((goal.kind, n, goal.t, e))
+
+    return Program(nodes, envs, obligations, table)
+
+def run(program, cache=None):
+    """
+    Determine whether every obligation of `program` succeeds, in order.
+
+    If `cache` is a `func_cache.FunctionCache`, function definitions it knows
+    to typecheck are skipped, and those which typecheck are added to it.
+    """
+
+    check.expr_memo.begin_run()
+    check.infer_memo.begin_run()
+
+    try:
+        for i in xrange(len(program)):
+            goal = program.goal(i)
+            key = _cache_key(cache, goal)
+
+            if key is not None and cache.get(key):
+                continue
+            if not discharge(goal):
+                return False
+            if key is not None:
+                cache.put(key)
+
+        return True
+    finally:
+        check.expr_memo.end_run()
+        check.infer_memo.end_run()
+
+def collect(program, cache=None):
+    """
+    Discharge every obligation of `program` like `run`, but instead of stopping
+    at the first one that fails, carry on, and return a list of `Diagnostic`s
+    for every failure (which is empty if the program typechecks).
+
+    A failure inside a statement list does not fail the list: it is recorded
+    and the rest of the list is checked as if the failed statement were fine.
+    Each failure is reported against the innermost goal that caused it.
+    """
+
+    failures = []
+    check.expr_memo.begin_run()
+    check.infer_memo.begin_run()
+
+    try:
+        for i in xrange(len(program)):
+            goal = program.goal(i)
+            key = _cache_key(cache, goal)
+
+            if key is not None and cache.get(key):
+                continue
+
+            n = len(failures)
+            _drive(goal, None, failures)
+            if key is not None and len(failures) == n:
+                cache.put(key)
+    finally:
+        check.expr_memo.end_run()
+        check.infer_memo.end_run()
+
+    return [_diagnostic(goal, error) for (goal, error) in failures]
+
+def _cache_key(cache, goal):
+    if cache is None or goal.kind is not check.STMT:
+        return None
+    return cache.fingerprint(goal.node, goal.env, goal.table)
+
+def discharge(goal):
+    """Return the result of `goal`, a `check.Goal`."""
+
+    return _drive(goal, None)
+
+def run_rule(result):
+    """
+    Return the result of applying a rule, given what the rule function
+    returned: a rule's generator is run to completion, and anything else is
+    already the result.
+    """
+
+    if result.__class__ is not _GENERATOR:
+        return result
+
+    return _drive(None, result)
+
+def _drive(goal, gen, failures=None):
+    """
+    Discharge `goal`, or if it is `None`, run the rule generator `gen`, and
+    return the result.
+
+    `stack` holds a frame for each suspended rule, innermost last. `pending` is
+    a goal that the innermost rule just yielded and that is yet to be started;
+    otherwise `value` is to be sent to the innermost rule.
+
+    If `failures` is a list, failures are appended to it as `(goal, error)`
+    pairs and recovered from as described in `collect`. `error` is the
+    `PytyError` a rule raised, or `None` if the goal was simply false.
+    """
+
+    base = tracing._depth
+    stack = [] if gen is None else [_Frame(gen, None, None, None, None)]
+    pending = goal
+    value = None
+
+    check.expr_memo.begin_run()
+    check.infer_memo.begin_run()
+
+    try:
+        while True:
+            if pending is not None:
+                (goal, pending) = (pending, None)
+
+                try:
+                    frame = _open(goal, base + len(stack))
+                except PytyError as e:
+                    if failures is None:
+                        raise
+                    value = _recover(stack, goal, e, failures)
+                else:
+                    if frame.__class__ is _Frame:
+                        stack.append(frame)
+                        value = None
+                    elif stack:
+                        value = _note(stack[-1], frame, goal, failures)
+                    else:
+                        if not frame and failures is not None:
+                            failures.append((goal, None))
+                        return frame
+
+                if not stack:
+                    return value
+
+            frame = stack[-1]
+
+            if tracing.enabled:
+                tracing._depth = base + len(stack)
+
+            try:
+                item = frame.gen.send(value)
+            except StopIteration:
+                item = None
+            except PytyError as e:
+                if failures is None:
+                    raise
+                blame = _innermost_goal(stack)
+                stack.pop()
+                value = _recover(stack, blame, e, failures)
+                if not stack:
+                    return value
+                continue
+
+            if item.__class__ is check.Goal or item.__class__ is _GENERATOR:
+
+                # A rule that carries on after a failed goal is trying
+                # another alternative, so no one goal is to blame.
+                if frame.blame is not None:
+                    frame.backtracked = True
+
+                if item.__class__ is check.Goal:
+                    pending = item
+                    if (frame.table is not None and item.table is None and
+                        (item.kind is check.STMT or
+                         item.kind is check.STMTS)):
+                        pending = item._replace(table=frame.table)
+                else:
+                    stack.append(_Frame(item, None, None, None, None,
+                                        frame.table))
+                    value = None
+            else:
+                stack.pop()
+                _close(frame, item, base + len(stack))
+                if frame.backtracked:
+                    blame = frame.goal
+                else:
+                    blame = frame.blame or frame.goal
+                if not stack:
+                    if not item and failures is not None:
+                        failures.append((blame, None))
+                    return item
+                value = _note(stack[-1], item, blame, failures)
+
+    finally:
+        tracing._depth = base
+        check.expr_memo.end_run()
+        check.infer_memo.end_run()
+
+def _note(parent, result, blame, failures):
+    """
+    Note that a goal yielded by the rule of frame `parent` has the result
+    `result`, and return the value to send to the rule. If the goal failed,
+    `blame` is the goal responsible.
+    """
+
+    if result:
+        parent.blame = None
+    elif (failures is not None and parent.goal is not None and
+          parent.goal.kind is check.STMTS):
+        failures.append((blame, None))
+        parent.blame = None
+        return True
+    else:
+        parent.blame = blame
+
+    return result
+
+def _recover(stack, blame, error, failures):
+    """
+    Record that `error` was raised while discharging the goal `blame`, and
+    abandon the rules on `stack` up to the innermost statement list. Returns
+    the value to send to that statement list's rule, or if there is none, the
+    result of the whole goal.
+    """
+
+    failures.append((blame, error))
+
+    while stack and (stack[-1].goal is None or
+                     stack[-1].goal.kind is not check.STMTS):
+        stack.pop()
+
+    return bool(stack)
+
+def _innermost_goal(stack):
+    for frame in reversed(stack):
+        if frame.goal is not None:
+            return frame.goal
+
+def _open(goal, depth):
+    """
+    Start `goal`, at nesting depth `depth`. Returns its result if it is already
+    known or its rule returns one immediately, and otherwise the `_Frame` of
+    its rule's generator.
+    """
+
+    node = goal.node
+    env = goal.env
+    key = None
+
+    if goal.kind is check.EXPR:
+        if env.__class__ is Env:
+            key = (node, goal.t, env.version)
+            result = check.expr_memo.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+
+        args = (node, goal.t, env)
+    elif goal.kind is check.STMTS:
+        args = (node, env, goal.table)
+    else:
+        args = (node, env)
+
+    rule = _rule(goal)
+
+    start = default_timer() if tracing.enabled else None
+
+    # If there is no rule, then we're inspecting an AST node that is not in
+    # the subset of the language we're considering (note: the subset is
+    # defined as whatever there are check function definitions for).
+    if rule is None:
+        result = False
+    else:
+        if start is not None:
+            tracing._depth = depth + 1
+        result = rule(*args)
+
+    if result.__class__ is _GENERATOR:
+        return _Frame(result, goal, key, start, rule, goal.table)
+
+    if key is not None:
+        check.expr_memo.put(key, result)
+    if start is not None:
+        _record(goal, rule, result, start, depth)
+
+    return result
+
+def _rule(goal):
+    """
+    Return the rule function for `goal`, or `None` if its node is outside the
+    language subset.
+    """
+
+    kind = goal.kind
+
+    if kind is check.EXPR:
+        return check.expr_rules.get(goal.node.__class__)
+    elif kind is check.STMT:
+        return check.stmt_rules.get(goal.node.__class__)
+    elif kind is check.STMTS:
+        return check._check_stmt_list
+    else:
+        return check._check_declaration
+
+def _close(frame, result, depth):
+    """Record `result` as the result of `frame`'s goal."""
+
+    if frame.key is not None:
+        check.expr_memo.put(frame.key, result)
+    if frame.start is not None:
+        _record(frame.goal, frame.rule, result, frame.start, depth)
+
+def _record(goal, rule, result, start, depth):
+    if tracing.enabled and (goal.kind is check.STMT or
+                            goal.kind is check.EXPR):
+        tracing.record(goal.kind, goal.node, goal.t, rule, result,
+                       default_timer() - start, depth)
+
+
+def _diagnostic(goal, error):
+    """Describe the failure of `goal`, which raised `error` if not `None`."""
+
+    node = goal.node
+    rule = _rule(goal)
+    inferred = None
+
+    if goal.kind is check.EXPR:
+        try:
+            inferred = check.infer_expr(node, goal.env)
+        except PytyError:
+            pass
+
+    if error.__class__ is TypeUnspecifiedError:
+        # Its string has the whole environment, which may be huge.
+        message = ("TypeUnspecifiedError: variable %s has unspecified type" %
+                   error.var)
+    elif error is not None:
+        message = error.__class__.__name__
+        if str(error):
+            message += ": " + str(error)
+    elif rule is None:
+        message = "unsupported %s" % goal.kind
+    elif goal.kind is check.EXPR:
+        message = "does not typecheck as %s" % goal.t
+    else:
+        message = "does not typecheck"
+
+    return Diagnostic(getattr(node, 'lineno', None),
+                      getattr(node, 'col_offset', None),
+                      node.__class__.__name__,
+                      rule.__name__ if rule else None,
+                      goal.t, inferred, message)
+
+
+class _Frame(object):
+    """
+    A rule in progress: its generator `gen`, and the `goal` it is for (or
+    `None` for a rule yielded by another rule), with the memo key, start time
+    (if traced) and rule function of that goal, and the `table` of type
+    declarations given to the statement goals the rule yields. `blame` is the
+    goal responsible for the failure of the last goal the rule yielded, if it
+    failed, and `backtracked` whether the rule went on to try another
+    alternative after one failed, in which case its own goal takes the blame.
+    """
+
+    __slots__ = ('gen', 'goal', 'key', 'start', 'rule', 'table', 'blame',
+                 'backtracked')
+
+    def __init__(self, gen, goal, key, start, rule, table=None):
+        self.gen = gen
+        self.goal = goal
+        self.key = key
+        self.start = start
+        self.rule = rule
+        self.table = table
+        self.blame = None
+        self.backtracked = False
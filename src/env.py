@@ -0,0 +1,231 @@
+import itertools
+
+"""
+Persistent type environments.
+
+An `Env` maps identifiers to PTypes and is never modified in place: extending
+it returns a new `Env` that shares all but O(log n) of its structure with the
+old one. The typechecker extends environments at every type declaration and
+function or lambda body, so this avoids copying the whole environment each
+time.
+
+The map is a hash array mapped trie. Each `_Node` branches 32 ways on five bits
+of the key's hash, and stores only its occupied branches along with a bitmap of
+which branches those are. A branch is either a leaf `(hash, key, value)` or a
+child node. Keys whose full hashes are equal end up in a `_Collision` bucket.
+"""
+
+_BITS = 5
+_WIDTH = 1 << _BITS
+_HASH_BITS = 64
+_HASH_MASK = (1 << _HASH_BITS) - 1
+
+# Source of `Env.version` numbers.
+_versions = itertools.count()
+
+def as_env(env):
+    """
+    Return `env` as an `Env`. `env` may already be one, or be any other mapping
+    of identifiers to PTypes (such as a dictionary), which is copied.
+    """
+
+    return env if env.__class__ is Env else Env(env)
+
+
+class Env(object):
+    """
+    An immutable mapping of identifiers to PTypes.
+
+    #### Instance variables
+    - `version`: an integer unique to this environment among all `Env`s made
+        by this process, usable as part of a cache key.
+    """
+
+    __slots__ = ('_root', '_len', 'version')
+
+    def __init__(self, mapping=None):
+        """
+        Create an environment with the entries of the mapping `mapping`, or an
+        empty one if `mapping` is `None`.
+        """
+
+        self._root = _EMPTY
+        self._len = 0
+        self.version = next(_versions)
+
+        if mapping:
+            for (k, v) in mapping.items():
+                (self._root, added) = _assoc(self._root, 0, _hash(k), k, v)
+                self._len += added
+
+    def extend(self, key, value):
+        """Return a new environment which also maps `key` to `value`."""
+
+        (root, added) = _assoc(self._root, 0, _hash(key), key, value)
+        return self._derive(root, self._len + added)
+
+    def extend_all(self, pairs):
+        """
+        Return a new environment which also maps each `k` to `v` for all
+        `(k, v)` in `pairs`, in order (so later pairs take precedence).
+        """
+
+        (root, n) = (self._root, self._len)
+        for (k, v) in pairs:
+            (root, added) = _assoc(root, 0, _hash(k), k, v)
+            n += added
+        return self._derive(root, n)
+
+    def _derive(self, root, n):
+        env = Env.__new__(Env)
+        env._root = root
+        env._len = n
+        env.version = next(_versions)
+        return env
+
+    def __getitem__(self, key):
+        return _lookup(self._root, _hash(key), key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        return (k for (k, v) in self.items())
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        """Return a list of the `(key, value)` pairs in this environment."""
+
+        pairs = []
+        stack = [self._root]
+
+        while stack:
+            node = stack.pop()
+            if node.__class__ is _Collision:
+                pairs.extend(node.pairs)
+            else:
+                for entry in node.entries:
+                    if entry.__class__ is tuple:
+                        pairs.append(entry[1:])
+                    else:
+                        stack.append(entry)
+
+        return pairs
+
+    def __repr__(self):
+        return "{" + ", ".join("%r: %s" % (k, v)
+                               for (k, v) in self.items()) + "}"
+
+
+class _Node(object):
+    __slots__ = ('bitmap', 'entries')
+
+    def __init__(self, bitmap, entries):
+        self.bitmap = bitmap
+        self.entries = entries
+
+
+class _Collision(object):
+    __slots__ = ('hash', 'pairs')
+
+    def __init__(self, h, pairs):
+        self.hash = h
+        self.pairs = pairs
+
+
+_EMPTY = _Node(0, ())
+
+def _hash(key):
+    return hash(key) & _HASH_MASK
+
+def _index(bitmap, bit):
+    """Position of branch `bit` among the occupied branches in `bitmap`."""
+
+    return bin(bitmap & (bit - 1)).count('1')
+
+def _lookup(node, h, key):
+    shift = 0
+
+    while True:
+        if node.__class__ is _Collision:
+            for (k, v) in node.pairs:
+                if k == key:
+                    return v
+            raise KeyError(key)
+
+        bit = 1 << ((h >> shift) & (_WIDTH - 1))
+        if not node.bitmap & bit:
+            raise KeyError(key)
+
+        entry = node.entries[_index(node.bitmap, bit)]
+        if entry.__class__ is tuple:
+            if entry[1] == key:
+                return entry[2]
+            raise KeyError(key)
+
+        node = entry
+        shift += _BITS
+
+def _assoc(node, shift, h, key, value):
+    """
+    Return a copy of `node`, at depth `shift` bits, which also maps `key` (of
+    hash `h`) to `value`, and whether `key` is new (as 1 or 0).
+    """
+
+    if node.__class__ is _Collision:
+        pairs = [(k, v) for (k, v) in node.pairs if k != key]
+        added = len(pairs) == len(node.pairs)
+        return (_Collision(h, tuple(pairs) + ((key, value),)), int(added))
+
+    bit = 1 << ((h >> shift) & (_WIDTH - 1))
+    i = _index(node.bitmap, bit)
+    entries = node.entries
+
+    if not node.bitmap & bit:
+        leaf = (h, key, value)
+        return (_Node(node.bitmap | bit, entries[:i] + (leaf,) + entries[i:]),
+                1)
+
+    entry = entries[i]
+
+    if entry.__class__ is tuple:
+        if entry[1] == key:
+            (child, added) = ((h, key, value), 0)
+        else:
+            (child, added) = (_merge(shift + _BITS, entry, (h, key, value)), 1)
+    else:
+        (child, added) = _assoc(entry, shift + _BITS, h, key, value)
+
+    return (_Node(node.bitmap, entries[:i] + (child,) + entries[i+1:]), added)
+
+def _merge(shift, leaf0, leaf1):
+    """Return a node, at depth `shift` bits, holding two leaves of new keys."""
+
+    (h0, h1) = (leaf0[0], leaf1[0])
+
+    if shift >= _HASH_BITS:
+        return _Collision(h0, (leaf0[1:], leaf1[1:]))
+
+    (b0, b1) = ((h0 >> shift) & (_WIDTH - 1), (h1 >> shift) & (_WIDTH - 1))
+
+    if b0 == b1:
+        return _Node(1 << b0, (_merge(shift + _BITS, leaf0, leaf1),))
+    elif b0 < b1:
+        return _Node((1 << b0) | (1 << b1), (leaf0, leaf1))
+    else:
+        return _Node((1 << b0) | (1 << b1), (leaf1, leaf0))
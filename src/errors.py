@@ -7,6 +7,9 @@ class TypeIncorrectlySpecifiedError(PytyError):
 class TypeMultiSpecifiedError(PytyError):
     pass
 
+class TypeSerializationError(PytyError):
+    pass
+
 class TypeUnspecifiedError(PytyError):
     def __init__(self, msg=None, var=None, env=None):
         super(TypeUnspecifiedError, self).__init__(msg)
@@ -0,0 +1,199 @@
+import os
+import ast
+import inspect
+import hashlib
+
+import ptype_codec
+
+import ast_extensions
+import check
+import engine
+import env
+import infer
+import unify
+import util
+import ptype
+
+"""
+An on-disk record of the function definitions known to typecheck, so that
+checking a module again after an edit only rechecks the functions which
+changed.
+
+A function is recorded under a fingerprint of everything its result depends
+on:
+- its definition, normalized by `ast.dump` (so without line numbers or column
+    offsets), along with the type declarations in its body, whether they are
+    in its statement lists or kept beside them in a
+    `ast_extensions.TypeDecTable`,
+- its declared arrow type,
+- the type, or absence, in the enclosing environment of every identifier the
+    definition mentions, and
+- the source of the modules implementing the typechecking rules, the engine
+    that runs them, type environments and type declaration placement, so
+    that changing any of them invalidates everything.
+
+Only successes are recorded, so a function which fails to typecheck is always
+checked again and reported in full.
+
+The file holds one hexadecimal fingerprint per line. New fingerprints are only
+written by `save`, which appends them.
+"""
+
+VERSION = 1
+
+# Digest of the typechecker's source, computed on first use.
+_checker_digest = None
+
+def _checker_source_digest():
+    global _checker_digest
+
+    if _checker_digest is None:
+        h = hashlib.sha1(str(VERSION))
+        for module in (ast_extensions, check, engine, env, infer, unify,
+                       util, ptype):
+            h.update(inspect.getsource(module))
+        _checker_digest = h.digest()
+
+    return _checker_digest
+
+def _identifiers(stmt, table=None):
+    """
+    Return the set of identifiers that the typechecking rules could look up in
+    an environment while checking `stmt`: those of its `Name`s, the names of
+    the functions, classes, parameters, globals and imports it defines, and
+    the targets of the type declarations `table` (if any) places within it.
+    """
+
+    ids = set()
+
+    if table is not None:
+        for (field, places) in _placed_typedecs(stmt, table):
+            for tdecs in places.values():
+                ids.update(tar.id for tdec in tdecs for tar in tdec.targets)
+
+    for node in ast.walk(stmt):
+        cls = node.__class__
+
+        if cls is ast.Name:
+            ids.add(node.id)
+        elif cls is ast.FunctionDef or cls is ast.ClassDef:
+            ids.add(node.name)
+        elif cls is ast.arguments:
+            ids.update(x for x in (node.vararg, node.kwarg) if x)
+        elif cls is ast.Global:
+            ids.update(node.names)
+        elif cls is ast.alias:
+            ids.add(node.asname or node.name.split(".")[0])
+
+    return ids
+
+def _placed_typedecs(stmt, table):
+    """
+    Return a list of `(field, places)` pairs, one for each statement list
+    within `stmt` that `table` places type declarations in, where `field` is
+    the list's field name and `places` is as returned by `table.places`.
+    """
+
+    placed = []
+
+    for node in ast.walk(stmt):
+        for (field, value) in ast.iter_fields(node):
+            places = table.places(value) if isinstance(value, list) else None
+            if places:
+                placed.append((field, places))
+
+    return placed
+
+def _dump_typedecs(stmt, table):
+    """
+    Return a normalized dump of the type declarations `table` places in the
+    statement lists within `stmt`, along with their positions.
+    """
+
+    return "\n".join("%s %s" % (field, sorted(
+                          (i, [ast.dump(tdec) for tdec in tdecs])
+                          for (i, tdecs) in places.items()))
+                      for (field, places) in _placed_typedecs(stmt, table))
+
+
+class FunctionCache(object):
+    """
+    The set of fingerprints of function definitions known to typecheck, read
+    from and saved to the file `path` (or kept only in memory if `path` is
+    `None`).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._known = set()
+        self._new = []
+        self.hits = 0
+        self.misses = 0
+
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as f:
+                self._known.update(line.strip() for line in f if line.strip())
+
+    def fingerprint(self, stmt, env, table=None):
+        """
+        Return the fingerprint of the statement `stmt` checked under the type
+        environment `env` with the type declarations placed by `table` (if
+        any), or `None` if `stmt` is not a function definition with a declared
+        type.
+        """
+
+        if stmt.__class__ is not ast.FunctionDef:
+            return None
+
+        try:
+            f_t = env[stmt.name]
+        except KeyError:
+            return None
+
+        ids = _identifiers(stmt, table)
+        present = dict((x, env[x]) for x in ids if x in env)
+        absent = sorted(ids - set(present))
+
+        h = hashlib.sha1(_checker_source_digest())
+        h.update(ast.dump(stmt))
+        h.update(ptype_codec.dumps(f_t))
+        h.update(ptype_codec.dumps_env(present))
+        h.update(" ".join(absent))
+        if table is not None:
+            h.update(_dump_typedecs(stmt, table))
+        return h.hexdigest()
+
+    def get(self, key):
+        """Return `True` if `key` is the fingerprint of a known success."""
+
+        if key in self._known:
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return None
+
+    def put(self, key):
+        """Record `key` as the fingerprint of a function which typechecks."""
+
+        if key not in self._known:
+            self._known.add(key)
+            self._new.append(key)
+
+    def save(self):
+        """Append the fingerprints recorded since the last save to the file."""
+
+        if self.path is None or not self._new:
+            return
+
+        with open(self.path, 'a') as f:
+            for key in self._new:
+                f.write(key + "\n")
+
+        self._new = []
+
+    def stats(self):
+        """Return a dictionary of the cache's size and counters."""
+
+        return {"size": len(self._known), "hits": self.hits,
+                "misses": self.misses}
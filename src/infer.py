@@ -1,10 +1,13 @@
 import ast
 import logging
 
-from util import cname, slice_range, node_is_int, valid_int_slice
+from util import (cname, slice_range, node_is_int, valid_int_slice,
+                  ast_node_classes, MemoTable)
 from errors import TypeUnspecifiedError
 from ptype import PType
 from settings import DEBUG_INFER
+from env import Env
+import tracing
 
 # Need to use this form to resolve circular import.
 import check
@@ -20,10 +23,8 @@ unit_t = PType.unit()
 log = None
 
 def i_debug(s, cond=True):
-    log.debug(s, DEBUG_INFER and cond)
-
-def call_function(fun_name, *args, **kwargs):
-    return globals()[fun_name](*args, **kwargs)
+    if log is not None:
+        log.debug(s, DEBUG_INFER and cond)
 
 def env_get(env, var_id):
     """
@@ -31,17 +32,25 @@ def env_get(env, var_id):
     `env`. Returns a PType. Raises `TypeUnspecifiedError` if `env` does not
     contain `var_id`.
 
-    - `env`: dictionary mapping strings to PTypes.
+    - `env`: `Env` (or dictionary) mapping strings to PTypes.
     - `var_id`: string representing identifier.
     """
 
-    # make sure the variable is in the environment
-    if var_id not in env:
-        i_debug("Type of %s not found in %s" % (var_id, env))
+    # return the type stored in the environment, if the variable is there
+    try:
+        return env[var_id]
+    except KeyError:
         raise TypeUnspecifiedError(var=var_id,env=env)
 
-    # return the type stored in the environment
-    return env[var_id]
+# Results of `infer_expr` under `Env`s, keyed by (expr node, environment
+# version). Checking rules often infer the same subexpression more than once,
+# and inferring a subscript infers its collection, so without this, chains like
+# `a[0][1][2]` cost quadratic work. As with `check.expr_memo`, entries can't go
+# stale, and the table only lasts for the outermost run: an engine run, or else
+# the outermost `infer_expr` call.
+infer_memo = MemoTable()
+
+_MISSING = object()
 
 def infer_expr(e, env):
     """
@@ -52,13 +61,37 @@ def infer_expr(e, env):
     assert isinstance(e, ast.expr), \
            "Should be inferring type of an expr node, not a " + cname(e)
 
-    n = get_infer_expr_func_name(e.__class__.__name__)
+    if env.__class__ is not Env:
+        return _apply_infer_rule(e, env)
+
+    key = (e, env.version)
+    t = infer_memo.get(key, _MISSING)
+
+    if t is _MISSING:
+        infer_memo.begin_run()
+        try:
+            t = _apply_infer_rule(e, env)
+            infer_memo.put(key, t)
+        finally:
+            infer_memo.end_run()
+
+    return t
 
-    # If we get a KeyError, then we're trying to infer the type of an AST node
+def _apply_infer_rule(e, env):
+    """Infer the type of `e` under `env` with its node class's rule."""
+
+    rule = infer_rules.get(e.__class__)
+
+    if tracing.enabled:
+        return tracing.traced("infer", e, None, rule, (e, env), None)
+
+    # If there is no rule, then we're trying to infer the type of an AST node
     # that is not in the very limited subset of the language that we're trying
     # to perform type inference on.
+    if rule is None:
+        return None
 
-    return call_function(n, e, env)
+    return rule(e, env)
 
 def get_infer_expr_func_name(expr_type):
     return "infer_%s_expr" % expr_type
@@ -161,9 +194,15 @@ def infer_List_expr(lst, env):
 
     elts_list = lst.elts
 
-    first_type = infer_expr(elts_list[0], env)
+    # The empty list's element type can't be determined.
+    first_type = infer_expr(elts_list[0], env) if elts_list else None
 
-    if all(check.check_expr(e, first_type, env) for e in elts_list[1:]):
+    if first_type is None:
+
+        # No assignment rule found.
+        return None
+
+    elif all(check.check_expr(e, first_type, env) for e in elts_list[1:]):
 
         # (lst) assignment rule.
         return PType.list(first_type)
@@ -185,16 +224,20 @@ def infer_Tuple_expr(tup, env):
     assert tup.__class__ is ast.Tuple
 
     elts_list = tup.elts
+    elt_ts = []
 
-    if all(infer_expr(e, env) != None for e in elts_list):
+    for e in elts_list:
+        e_t = infer_expr(e, env)
 
-        # (tup) assignment rule.
-        return PType.tuple([infer_expr(e, env) for e in elts_list])
+        if e_t is None:
 
-    else:
+            # No assignment rule found.
+            return None
 
-        # No assignment rule found.
-        return None
+        elt_ts.append(e_t)
+
+    # (tup) assignment rule.
+    return PType.tuple(elt_ts)
 
 def infer_Subscript_expr(subs, env):
     """
@@ -220,7 +263,11 @@ def infer_Subscript_expr(subs, env):
 
     is_index = subs.slice.__class__ is ast.Index
     is_slice = subs.slice.__class__ is ast.Slice
-    assert is_index or is_slice
+
+    if not is_index and not is_slice:
+
+        # Extended slices have no assignment rule.
+        return None
 
     # Store the attributes of the slice.
     if is_index:
@@ -306,3 +353,32 @@ def infer_Subscript_expr(subs, env):
 
         # No assignment rule found.
         return None
+
+
+
+## Rule Dispatch.
+
+# Map from AST node classes to the functions inferring their types, filled in
+# from the `infer_X_expr` functions above when this module is loaded.
+infer_rules = {}
+
+def register_infer_rule(node_class, rule):
+    """
+    Infer the types of expressions of AST node class `node_class` with
+    `rule(expr, env)`, replacing any rule already registered for that class.
+    `rule` returns a PType, or `None` if it can't determine one.
+    """
+
+    infer_rules[node_class] = rule
+
+def _register_rules():
+    """Register the `infer_X_expr` functions above."""
+
+    rules = globals()
+
+    for node_class in ast_node_classes():
+        name = get_infer_expr_func_name(node_class.__name__)
+        if name in rules:
+            register_infer_rule(node_class, rules[name])
+
+_register_rules()
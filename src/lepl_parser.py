@@ -0,0 +1,121 @@
+"""
+The LEPL grammar for type specifications that Pyty used before the
+hand-written parser in ptype.py replaced it. Nothing in Pyty depends on this
+module; it is kept as a reference implementation for the type spec tests and
+for benchmarking the new parser against.
+"""
+
+from lepl import (List, Token, Delayed, RuntimeLexerError,
+                  FullFirstMatchException, sexpr_to_tree)
+
+from errors import TypeIncorrectlySpecifiedError
+from ptype import PType
+
+def better_sexpr_to_tree(a):
+    if type(a) == str:
+        return a
+    else:
+        return sexpr_to_tree(a)
+
+class Lst(List):
+    def elt_t(self):
+        return self[0]
+
+class Tup(List):
+    def elt_ts(self):
+        return [t for t in self]
+
+class Arr(List):
+    def domain_t(self):
+        return self[0]
+
+    def range_t(self):
+        return self[1]
+
+class LEPLTypeSpecParser:
+    int_tok = Token(r'int')
+    float_tok = Token(r'float')
+    str_tok = Token(r'str')
+    unicode_tok = Token(r'unicode')
+    bool_tok = Token(r'bool')
+    unit_tok = Token(r'unit')
+    var_tok = Token(r"'[a-zA-Z0-9]+")
+
+    list_start = Token(r'\[')
+    list_end = Token(r'\]')
+
+    tuple_start = Token(r'\(')
+    tuple_div = Token(r',')
+    tuple_end = Token(r'\)')
+
+    arrow_div = Token(r'\->')
+
+    tight_typ = Delayed()
+    typ = Delayed()
+
+    num_typ = int_tok | float_tok # | long_tok | complex_tok
+    str_typ = str_tok | unicode_tok
+    base_typ = num_typ | str_typ | bool_tok | unit_tok | var_tok
+
+    lst = ~list_start & typ & ~list_end > Lst
+
+    empty_tup = ~tuple_start & ~tuple_end > Tup
+    comma_tup = ~tuple_start & (typ & ~tuple_div)[1:] & ~tuple_end > Tup
+    no_comma_tup = ~tuple_start & (typ & ~tuple_div)[1:] & typ & ~tuple_end > Tup
+    tup = empty_tup | comma_tup | no_comma_tup
+
+    arr = tight_typ & ~arrow_div & typ > Arr
+
+    parens = ~tuple_start & typ & ~tuple_end
+    tight_typ += base_typ | lst | tup | parens
+    typ += arr | tight_typ
+
+    @staticmethod
+    def parse(s):
+        try:
+            return LEPLTypeSpecParser.typ.parse(s)[0]
+        except (RuntimeLexerError, FullFirstMatchException):
+            raise TypeIncorrectlySpecifiedError(s)
+
+
+    @staticmethod
+    def print_parse(s):
+        try:
+            return better_sexpr_to_tree(LEPLTypeSpecParser.typ.parse(s)[0])
+        except (RuntimeLexerError, FullFirstMatchException):
+            raise TypeIncorrectlySpecifiedError(s)
+
+
+def from_type_ast(ast):
+    """Create a PType object from a LEPL-generated type AST."""
+
+    # shorthand.
+    from_ast = from_type_ast
+
+    if type(ast) is str:
+        if ast == "int":
+            return PType.int()
+        elif ast == "float":
+            return PType.float()
+        elif ast == "str":
+            return PType.string()
+        elif ast == "unicode":
+            return PType.unicode()
+        elif ast == "bool":
+            return PType.bool()
+        elif ast == "unit":
+            return PType.unit()
+        elif ast.index("'") == 0:
+            return PType.var(ast)
+        else:
+            assert True, ast
+    elif ast.__class__ == Lst:
+        return PType.list(from_ast(ast.elt_t()))
+    elif ast.__class__ == Tup:
+        return PType.tuple([from_ast(t) for t in ast.elt_ts()])
+    elif ast.__class__ == Arr:
+        return PType.arrow(from_ast(ast.domain_t()),
+                           from_ast(ast.range_t()))
+    else:
+        # Note that there's no UNIV case; shouldn't be user-specifiable.
+        assert True, ast.__class__.__name__
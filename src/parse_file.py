@@ -11,16 +11,76 @@ from logger import Logger
 log = None
 
 def p_debug(s, cond=True):
-    log.debug(s, DEBUG_TYPEDEC_PARSING and cond)
+    if log is not None:
+        log.debug(s, DEBUG_TYPEDEC_PARSING and cond)
 
 # the \s are regexes for whitespace. the first group contains a regex for valid
-# Python variable identifiers; the second group catches anything,
-_TYPEDEC_REGEX = r".*#:\s*(?P<id>[a-zA-Z]\w*)\s*:\s*(?P<t>.*)\s*"
+# Python variable identifiers; the second group catches anything. it is matched
+# at a '#:' inside a comment.
+_TYPEDEC_REGEX = re.compile(r"#:\s*(?P<id>[a-zA-Z]\w*)\s*:\s*(?P<t>.*)")
+
+# matches each comment and string literal in source code, in the same places as
+# the tokenizer's COMMENT and STRING tokens (a string's prefix doesn't change
+# where it ends, so is left out), but in one pass of a compiled regex.
+_COMMENT_SCAN_REGEX = re.compile("|".join([
+    r"(?P<comment>#[^\r\n]*)",
+    r"'''[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''",
+    r'"""[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""',
+    r"'[^\n'\\]*(?:\\.[^\n'\\]*)*'",
+    r'"[^\n"\\]*(?:\\.[^\n"\\]*)*"']), re.DOTALL)
+
+def read_source(filename):
+    """Reads the source code in C{filename} in a single pass.
+
+    The text is returned undecoded, as a C{str}: the Python parser decodes it
+    itself, following any encoding declaration in the file.
+
+    @type filename: str
+    @param filename: the path of the source file.
+    @rtype: str
+    @return: the contents of the file.
+    """
+
+    with open(filename, 'rb') as f:
+        return f.read()
+
+def parse_source(text, filename='<unknown>'):
+    """Parses the source code C{text} into a typed AST, finding both the
+    Python AST and the type declarations in the same text, without any file
+    I/O.
+
+    @type text: str
+    @param text: the source code of a module.
+    @type filename: str
+    @param filename: the file name to report in syntax errors.
+    @rtype: L{ast_extensions.TypeDecASTModule}
+    @return: a typed view of the module's AST and its type declarations.
+    """
+
+    return TypeDecASTModule(ast.parse(text, filename),
+                            parse_type_decs_text(text))
+
+def parse_source_file(filename):
+    """Reads C{filename} once with L{read_source} and parses it with
+    L{parse_source}.
+
+    @rtype: L{ast_extensions.TypeDecASTModule}
+    """
+
+    return parse_source(read_source(filename), filename)
 
 def parse_type_decs(filename):
-    """Scans through the contents of C{filename} to find lines which contain a
-    comment of the form '#: x : int' at the beginning (excluding whitespace) and
-    creates a list of L{ast_extensions.TypeDec} nodes.
+    """Reads C{filename} with L{read_source} and returns the
+    L{ast_extensions.TypeDec} nodes found in it by L{parse_type_decs_text}.
+    """
+
+    return parse_type_decs_text(read_source(filename))
+
+def parse_type_decs_text(text):
+    """Scans through the source code C{text} to find comments which contain a
+    declaration of the form '#: x : int' and creates a list of
+    L{ast_extensions.TypeDec} nodes. A '#:' inside a string literal is not a
+    declaration.
 
     TODO: This currently only handles single declarations like '#: x : int', but
     we want it to also handle things like '#: x,y : int' and
@@ -35,25 +95,30 @@ def parse_type_decs(filename):
     """
 
     tdecs = []
-    lineno = 0
 
     p_debug("--- v Typedec parsing v ---")
 
-    for l in open(filename, 'r'):
-        # move to next line
-        lineno += 1
+    # most files have no declarations at all, so don't scan those.
+    if '#:' in text:
+        # (lineno, offset of the start of that line) of the last comment.
+        (lineno, line_start) = (1, 0)
 
-        m = re.match(_TYPEDEC_REGEX, l)
+        for m in _COMMENT_SCAN_REGEX.finditer(text):
+            comment = m.group('comment')
+            if not comment or '#:' not in comment:
+                continue
 
-        p_debug(" tdec --> " + l[:-1], m)
-        p_debug("          " + l[:-1], not m)
+            start = m.start()
+            lineno += text.count('\n', line_start, start)
+            line_start = text.rfind('\n', 0, start) + 1
 
-        if m:
-            var_name = m.group('id')
-            type_spec = m.group('t').split('#')[0].strip()
+            tdec = parse_type_dec_comment(comment, lineno, start - line_start)
 
-            tdec = parse_type_dec(l, lineno, var_name, type_spec)
-            tdecs.append(tdec)
+            p_debug(" tdec --> " + comment, tdec)
+            p_debug("          " + comment, not tdec)
+
+            if tdec:
+                tdecs.append(tdec)
 
     p_debug("--- ^ Typedec parsing ^ ---")
 
@@ -91,30 +156,37 @@ def parse_type_decs(filename):
 
 
 
-def parse_type_dec(line, lineno, var_name, type_spec):
+def parse_type_dec_comment(comment, lineno, col):
     """Constructs a L{ast_extensions.TypeDec} from the type declaration in the
-    provided line. The name of the variable and the name of the type are passed
-    since they are stored when matching the typedec regex against the line and
-    it would be wasteful to discard that information.
+    provided comment, if it has one. If several '#:'s in the comment start a
+    declaration, the last one is used.
 
-    @type line: str
-    @param line: the line of source code containing the type declaration.
+    @type comment: str
+    @param comment: the text of the comment, from its '#' to the end of the
+        line.
     @type lineno: int
-    @param lineno: the index of this line in the orginial source code file.
-    @type var_name: str
-    @param var_name: the name of the identifier whose type is being declared.
-    @type type_name: str
-    @param type_name: the name of the type which is being declared.
-    @rtype: L{ast_extensions.TypeDec}
+    @param lineno: the line number of the comment in the source code.
+    @type col: int
+    @param col: the column of the comment's '#' on that line.
+    @rtype: L{ast_extensions.TypeDec} or C{None}
     @return: a L{ast_extensions.TypeDec} node for the declaration in the given
-        line.
+        comment, or C{None} if there is none.
     """
 
-    col = line.index(var_name)
-    name_node = ast.Name(ctx=TypeStore(), id=var_name, lineno=lineno,
-                         col_offset=col)
+    i = comment.rfind('#:')
+
+    while i >= 0:
+        m = _TYPEDEC_REGEX.match(comment, i)
+        if m:
+            var_name = m.group('id')
+            type_spec = m.group('t').split('#')[0].strip()
+
+            name_node = ast.Name(ctx=TypeStore(), id=var_name, lineno=lineno,
+                                 col_offset=col + m.start('id'))
+
+            return TypeDec([name_node], PType.from_str(type_spec), lineno,
+                           col + i)
 
-    col_offset = line.index("#:")
+        i = comment.rfind('#:', 0, i)
 
-    return TypeDec([name_node], PType.from_str(type_spec), lineno,
-                   col_offset)
+    return None
@@ -1,11 +1,87 @@
 import re
-from lepl import (List, Token, Delayed, RuntimeLexerError,
-                  FullFirstMatchException, sexpr_to_tree)
+import weakref
 
 from errors import TypeIncorrectlySpecifiedError
+from settings import TYPE_SPEC_CACHE_SIZE
+from util import LRUCache
 
 
-class PType:
+def _child(tag, index, name):
+    """
+    Build a read-only property for child `index` of a PType's structural key,
+    only present on types tagged `tag`.
+    """
+
+    def get(self):
+        if self.tag != tag:
+            raise AttributeError("%r has no attribute '%s'" % (self, name))
+        return self._key[index]
+
+    return property(get)
+
+
+_MASK = (1 << 64) - 1
+
+def _mix(h):
+    """The splitmix64 finalizer, which scatters the bits of `h`."""
+
+    h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & _MASK
+    h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & _MASK
+    return h ^ (h >> 31)
+
+# Tuple types hash their elements as a polynomial modulo a Mersenne prime, so
+# that the hash of any contiguous run of a tuple's elements can be found in
+# O(1) from prefix sums (see TupleSlice).
+_P = (1 << 61) - 1
+_B = 0x1f3d5b79a2c4e687 % _P
+_powers = [1]
+
+def _power(k):
+    """Return `_B ** k` modulo `_P`."""
+
+    while len(_powers) <= k:
+        _powers.append(_powers[-1] * _B % _P)
+    return _powers[k]
+
+def _poly(hashes):
+    p = 0
+    for h in hashes:
+        p = (p * _B + h) % _P
+    return p
+
+def _signed(h):
+    # Fold to a signed machine-sized int so hash() doesn't rehash it.
+    return int(h - (1 << 64) if h >= (1 << 63) else h)
+
+def _tuple_hash(poly, n):
+    return _signed(_mix((poly + n * 0x9e3779b97f4a7c15 + 7) & _MASK))
+
+def _structural_hash(key):
+    """
+    Hash a PType's structural key from its tag and its children's hashes.
+    Python's own tuple hash is no good here: applied to its own output over
+    and over, as it is for deeply nested types, it collapses onto a handful
+    of values.
+    """
+
+    if key[0] == PType.TUPLE:
+        return _tuple_hash(_poly(hash(c) for c in key[1]), len(key[1]))
+
+    h = key[0] + 1
+    for c in key[1:]:
+        h = _mix((h * 0x100000001b3 + hash(c)) & _MASK)
+
+    return _signed(h)
+
+
+class PType(object):
+    """
+    An immutable Pyty type. Each instance is a tag plus a fixed-arity key
+    `(tag, child, ...)` holding its children; for tuples the single child is
+    the Python tuple of element types. The structural hash is computed once,
+    when the type is built. Free type variables and the quantified form are
+    filled in on first use.
+    """
 
     # Literals.
     INT = 0
@@ -24,128 +100,149 @@ class PType:
     VAR = 9
     UNIV = 10
 
-    def __init__(self, tag):
-        assert type(tag) is int and 0 <= tag <= 10
-        self.tag = tag
+    __slots__ = ('tag', '_key', '_hash', '_ftv', '_quant', '__weakref__')
+
+    # Every PType is hash-consed: there is exactly one live instance for each
+    # type structure, so type equality is an identity check. The table maps a
+    # type's structural key (its tag followed by its children) to that
+    # canonical instance, and only holds it weakly.
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, key):
+        """
+        Return the canonical PType with structural key `key`, creating it if no
+        such type is currently alive. Children in `key` must themselves be
+        canonical, which holds for anything built with the type constructors.
+        """
+
+        t = PType._interned.get(key)
+        if t is not None:
+            return t
+
+        assert type(key[0]) is int and 0 <= key[0] <= 10
+
+        # A tuple slice view compares equal to its canonical tuple, so it
+        # finds that tuple's entry above; it must not end up in a new key.
+        if key[0] == PType.TUPLE:
+            if any(c.__class__ is TupleSlice for c in key[1]):
+                key = (PType.TUPLE, tuple(_canonical(c) for c in key[1]))
+        elif any(c.__class__ is TupleSlice for c in key[1:]):
+            key = (key[0],) + tuple(_canonical(c) for c in key[1:])
+
+        t = object.__new__(cls)
+        object.__setattr__(t, 'tag', key[0])
+        object.__setattr__(t, '_key', key)
+        object.__setattr__(t, '_hash', _structural_hash(key))
+        object.__setattr__(t, '_ftv', None)
+        object.__setattr__(t, '_quant', None)
+
+        PType._interned[key] = t
+        return t
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PType objects are immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("PType objects are immutable")
+
+    ## Children.
+
+    elt = _child(LIST, 1, 'elt')
+    elts = _child(TUPLE, 1, 'elts')
+    dom = _child(ARROW, 1, 'dom')
+    ran = _child(ARROW, 2, 'ran')
+    idn = _child(VAR, 1, 'idn')
+    qnt = _child(UNIV, 1, 'qnt')
+    ovr = _child(UNIV, 2, 'ovr')
 
     ## Type constructor dispatchers.
 
     @staticmethod
     def from_str(s):
-        """Create a PType object from a string."""
+        """
+        Create a PType object from a string. Single-token specs are looked up
+        directly; other parsed types are kept in `spec_cache`, keyed on the
+        spec with insignificant whitespace removed.
+        """
 
-        parsed = TypeSpecParser.parse(s)
-        return PType.from_type_ast(parsed)
+        t = _BASE_TYPES.get(s)
+        if t is not None:
+            return t
+        elif s[:1] == "'" and _VAR_RE.match(s):
+            return PType.var(s)
 
-    @staticmethod
-    def from_type_ast(ast):
-        """Create a PType object from a LEPL-generated type AST."""
-
-        # shorthand.
-        from_ast = PType.from_type_ast
-
-        if type(ast) is str:
-            if ast == "int":
-                return PType.INT_T
-            elif ast == "float":
-                return PType.FLOAT_T
-            elif ast == "str":
-                return PType.STR_T
-            elif ast == "unicode":
-                return PType.UNICODE_T
-            elif ast == "bool":
-                return PType.BOOL_T
-            elif ast == "unit":
-                return PType.UNIT_T
-            elif ast.index("'") == 0:
-                return PType.var(ast)
-            else:
-                assert True, ast
-        elif ast.__class__ == Lst:
-            return PType.list(from_ast(ast.elt_t()))
-        elif ast.__class__ == Tup:
-            return PType.tuple([from_ast(t) for t in ast.elt_ts()])
-        elif ast.__class__ == Arr:
-            return PType.arrow(from_ast(ast.domain_t()),
-                               from_ast(ast.range_t()))
-        else:
-            # Note that there's no UNIV case; shouldn't be user-specifiable.
-            assert True, ast.__class__.__name__
+        key = _SPEC_SPACE_RE.sub(_squeeze_space, s).strip()
+
+        t = spec_cache.get(key)
+        if t is None:
+            t = TypeSpecParser.parse(s)
+            spec_cache.put(key, t)
+
+        return t
 
     ## Type constructors.
 
     @staticmethod
     def int():
         if not hasattr(PType, 'INT_T'):
-            PType.INT_T = PType(PType.INT)
+            PType.INT_T = PType((PType.INT,))
         return PType.INT_T
 
     @staticmethod
     def float():
         if not hasattr(PType, 'FLOAT_T'):
-            PType.FLOAT_T = PType(PType.FLOAT)
+            PType.FLOAT_T = PType((PType.FLOAT,))
         return PType.FLOAT_T
 
     @staticmethod
     def string():
         if not hasattr(PType, 'STR_T'):
-            PType.STR_T = PType(PType.STRING)
+            PType.STR_T = PType((PType.STRING,))
         return PType.STR_T
 
     @staticmethod
     def unicode():
         if not hasattr(PType, 'UNICODE_T'):
-            PType.UNICODE_T = PType(PType.UNICODE)
+            PType.UNICODE_T = PType((PType.UNICODE,))
         return PType.UNICODE_T
 
 
     @staticmethod
     def bool():
         if not hasattr(PType, 'BOOL_T'):
-            PType.BOOL_T = PType(PType.BOOL)
+            PType.BOOL_T = PType((PType.BOOL,))
         return PType.BOOL_T
 
     @staticmethod
     def unit():
         if not hasattr(PType, 'UNIT_T'):
-            PType.UNIT_T = PType(PType.UNIT)
+            PType.UNIT_T = PType((PType.UNIT,))
         return PType.UNIT_T
 
     @staticmethod
     def list(elt):
-        t = PType(PType.LIST)
-        t.elt = elt
-        return t
+        return PType((PType.LIST, elt))
 
     @staticmethod
     def tuple(elts):
-        t = PType(PType.TUPLE)
-        t.elts = elts
-        return t
+        return PType((PType.TUPLE, tuple(elts)))
 
     @staticmethod
     def arrow(dom, ran):
-        t = PType(PType.ARROW)
-        t.dom = dom
-        t.ran = ran
-        return t
+        return PType((PType.ARROW, dom, ran))
 
     @staticmethod
     def var(idn):
-        t = PType(PType.VAR)
-        t.idn = idn
-        return t
+        return PType((PType.VAR, idn))
 
     @staticmethod
     def univ(qnt, ovr):
-        t = PType(PType.UNIV)
-        t.qnt = qnt
-        t.ovr = ovr
-        return t
+        return PType((PType.UNIV, qnt, ovr))
 
     ## Type tests.
     # Note these are unnecessary for the nullary type constructors becasue those
-    # are singletons and can be compared with object equality.
+    # are singletons and can be compared with object equality (as can every
+    # other type, since they're all interned).
 
     def is_base(self):
         return self.tag <= PType.UNIT
@@ -205,128 +302,363 @@ class PType:
             assert True, self.tag
 
     def __hash__(self):
-        return hash(self.__repr__())
+        return self._hash
 
     def __eq__(self, other):
-        return self.__repr__() == other.__repr__()
+        return self is other or (other.__class__ is TupleSlice and
+                                 other.__eq__(self))
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    # Copying would break the one-instance-per-type invariant, and there's no
+    # need for it since types are never modified after construction.
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    # Pickle through the compact encoding in ptype_codec, which re-interns the
+    # type on load. (Imported here to avoid a circular import.)
+
+    def __reduce__(self):
+        import ptype_codec
+        return (ptype_codec.loads, (ptype_codec.dumps(self),))
+
     ## Special methods.
 
     def tuple_slice(self, start=0, end=None, step=1):
+        """
+        Return the tuple type of `self.elts[start:end:step]`. Contiguous
+        slices are `TupleSlice` views which share this type's elements.
+        """
 
         assert self.is_tuple()
 
         if end is None:
-            end = len(self.elts)
+            end = self.tuple_len()
 
-        return PType.tuple(self.elts[start:end:step])
+        (start, end, step) = slice(start, end, step).indices(self.tuple_len())
+
+        if step != 1:
+            return PType.tuple(self.elts[start:end:step])
+        elif start == 0 and end == self.tuple_len():
+            return self
+        else:
+            return TupleSlice(self, start, max(start, end))
 
     def tuple_len(self):
         assert self.is_tuple()
-        return len(self.elts)
+        return len(self._key[1])
 
     def free_type_vars(self):
+        """
+        Return the frozenset of type variables occurring free in this type.
+        This is computed once per type and then cached on it.
+        """
+
+        ftv = self._ftv
+
+        if ftv is None:
+            if self.is_base():
+                ftv = _NO_VARS
+            elif self.is_list():
+                ftv = self.elt.free_type_vars()
+            elif self.is_tuple():
+                ftv = frozenset().union(*[elt.free_type_vars()
+                                          for elt in self.elts])
+            elif self.is_arrow():
+                ftv = self.dom.free_type_vars() | self.ran.free_type_vars()
+
+            elif self.is_var():
+                ftv = frozenset([self])
+            elif self.is_univ():
+                ftv = self.ovr.free_type_vars() - frozenset([self.qnt])
 
-        if self.is_base():
-            return set()
-        elif self.is_list():
-            return self.elt.free_type_vars()
-        elif self.is_tuple():
-            return set().union(*[elt.free_type_vars() for elt in self.elts])
-        elif self.is_arrow():
-            return self.dom.free_type_vars() | self.ran.free_type_vars()
+            else:
+                assert True, self.tag
 
-        elif self.is_var():
-            return {self}
-        elif self.is_univ():
-            return self.ovr.free_type_vars() - {self.qnt}
+            object.__setattr__(self, '_ftv', ftv)
 
-        else:
-            assert True, self.tag
+        return ftv
 
     def quantify(self):
+        """
+        Return this type universally quantified over its free type variables,
+        outermost quantifier first in order of variable name. The result is
+        cached on the type.
+        """
+
+        ftv = self.free_type_vars()
+
+        # Types without free variables are their own quantification; don't
+        # cache those, so they don't refer to themselves.
+        if not ftv:
+            return self
 
-        quant = self
+        quant = self._quant
 
-        for v in self.free_type_vars():
-            quant = PType.univ(v, quant)
+        if quant is None:
+            quant = self
+            for v in sorted(ftv, key=lambda v: v.idn, reverse=True):
+                quant = PType.univ(v, quant)
+
+            object.__setattr__(self, '_quant', quant)
 
         return quant
 
 
-def better_sexpr_to_tree(a):
-    if type(a) == str:
-        return a
-    else:
-        return sexpr_to_tree(a)
+_NO_VARS = frozenset()
+
+
+def _canonical(t):
+    return t.materialize() if t.__class__ is TupleSlice else t
+
+
+class TupleSlice(PType):
+    """
+    A tuple type that is the contiguous run `base.elts[start:stop]` of another
+    tuple type, built in O(1) without copying any elements. A slice compares
+    and hashes equal to the interned tuple type with the same elements, which
+    `materialize` returns. Its hash is found in O(1) from prefix hashes of the
+    base tuple, computed once per base.
+    """
+
+    __slots__ = ('_base', '_start', '_stop')
+
+    # Prefix polynomial hashes of the elements of each tuple that has been
+    # sliced, computed on first use.
+    _prefixes = weakref.WeakKeyDictionary()
 
-class Lst(List):
-    def elt_t(self):
-        return self[0]
+    def __new__(cls, base, start, stop):
+        assert base.__class__ is PType and base.is_tuple()
 
-class Tup(List):
-    def elt_ts(self):
-        return [t for t in self]
+        t = object.__new__(cls)
+        for (name, value) in [('tag', PType.TUPLE), ('_key', None),
+                              ('_hash', None), ('_ftv', None),
+                              ('_quant', None), ('_base', base),
+                              ('_start', start), ('_stop', stop)]:
+            object.__setattr__(t, name, value)
 
-class Arr(List):
-    def domain_t(self):
-        return self[0]
+        return t
+
+    @property
+    def elts(self):
+        return _SliceSeq(self._base.elts, self._start, self._stop)
+
+    def tuple_len(self):
+        return self._stop - self._start
+
+    def tuple_slice(self, start=0, end=None, step=1):
+        if end is None:
+            end = self.tuple_len()
+
+        (start, end, step) = slice(start, end, step).indices(self.tuple_len())
+
+        if step != 1:
+            return PType.tuple(self.elts[start:end:step])
+        else:
+            return self._base.tuple_slice(self._start + start,
+                                          self._start + max(start, end))
+
+    def materialize(self):
+        """Return the interned tuple type with this slice's elements."""
+
+        return PType.tuple(self._base.elts[self._start:self._stop])
+
+    def __hash__(self):
+        h = self._hash
+
+        if h is None:
+            pre = TupleSlice._prefixes.get(self._base)
+            if pre is None:
+                pre = [0]
+                for elt in self._base.elts:
+                    pre.append((pre[-1] * _B + hash(elt)) % _P)
+                TupleSlice._prefixes[self._base] = pre
+
+            (i, j) = (self._start, self._stop)
+            poly = (pre[j] - pre[i] * _power(j - i)) % _P
+            h = _tuple_hash(poly, j - i)
+            object.__setattr__(self, '_hash', h)
+
+        return h
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        elif not isinstance(other, PType) or not other.is_tuple():
+            return False
+        elif (self.tuple_len() != other.tuple_len() or
+              hash(self) != hash(other)):
+            return False
+        else:
+            return all(a is b for (a, b) in zip(self.elts, other.elts))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def free_type_vars(self):
+        return self.materialize().free_type_vars()
+
+    def quantify(self):
+        return self.materialize().quantify()
+
+
+class _SliceSeq(object):
+    """A read-only view of `seq[start:stop]` for a tuple `seq`."""
 
-    def range_t(self):
-        return self[1]
+    __slots__ = ('seq', 'start', 'stop')
 
-class TypeSpecParser:
-    int_tok = Token(r'int')
-    float_tok = Token(r'float')
-    str_tok = Token(r'str')
-    unicode_tok = Token(r'unicode')
-    bool_tok = Token(r'bool')
-    unit_tok = Token(r'unit')
-    var_tok = Token(r"'[a-zA-Z0-9]+")
+    def __init__(self, seq, start, stop):
+        self.seq = seq
+        self.start = start
+        self.stop = stop
 
-    list_start = Token(r'\[')
-    list_end = Token(r'\]')
+    def __len__(self):
+        return self.stop - self.start
 
-    tuple_start = Token(r'\(')
-    tuple_div = Token(r',')
-    tuple_end = Token(r'\)')
+    def __iter__(self):
+        seq = self.seq
+        return (seq[i] for i in xrange(self.start, self.stop))
 
-    arrow_div = Token(r'\->')
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return tuple(self)[i]
 
-    tight_typ = Delayed()
-    typ = Delayed()
+        n = self.stop - self.start
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("tuple index out of range")
+        return self.seq[self.start + i]
 
-    num_typ = int_tok | float_tok # | long_tok | complex_tok
-    str_typ = str_tok | unicode_tok
-    base_typ = num_typ | str_typ | bool_tok | unit_tok | var_tok
 
-    lst = ~list_start & typ & ~list_end > Lst
+class TypeSpecParser(object):
+    """
+    Hand-written parser for type specifications. Specs are split into tokens
+    by a single regex and then parsed by recursive descent into PTypes:
 
-    empty_tup = ~tuple_start & ~tuple_end > Tup
-    comma_tup = ~tuple_start & (typ & ~tuple_div)[1:] & ~tuple_end > Tup
-    no_comma_tup = ~tuple_start & (typ & ~tuple_div)[1:] & typ & ~tuple_end > Tup
-    tup = empty_tup | comma_tup | no_comma_tup
+        typ   ::= tight | tight -> typ
+        tight ::= int | float | str | unicode | bool | unit | 'var
+                | [typ] | (typ) | () | (typ,) | (typ, ..., typ[,])
 
-    arr = tight_typ & ~arrow_div & typ > Arr
+    `->` is right-associative. This accepts exactly the language of the LEPL
+    grammar it replaced (see lepl_parser.py).
+    """
 
-    parens = ~tuple_start & typ & ~tuple_end
-    tight_typ += base_typ | lst | tup | parens
-    typ += arr | tight_typ
+    _TOKEN_RE = re.compile(r"\s*(?:(->|[\[\](),])|('[a-zA-Z0-9]+|\w+)|(\S))")
+
+    def __init__(self, s):
+        self.s = s
+        self.toks = TypeSpecParser._tokenize(s)
+        self.pos = 0
 
     @staticmethod
     def parse(s):
-        try:
-            return TypeSpecParser.typ.parse(s)[0]
-        except (RuntimeLexerError, FullFirstMatchException):
-            raise TypeIncorrectlySpecifiedError(s)
+        """
+        Parse the type specification string `s` into a PType. Raises
+        `TypeIncorrectlySpecifiedError` if `s` is not a valid type spec.
+        """
+
+        p = TypeSpecParser(s)
+        t = p._typ()
 
+        if p.pos != len(p.toks):
+            p._fail()
+
+        return t
 
     @staticmethod
-    def print_parse(s):
-        try:
-            return better_sexpr_to_tree(TypeSpecParser.typ.parse(s)[0])
-        except (RuntimeLexerError, FullFirstMatchException):
-            raise TypeIncorrectlySpecifiedError(s)
+    def _tokenize(s):
+        toks = []
+
+        for (punct, word, junk) in TypeSpecParser._TOKEN_RE.findall(s):
+            if junk:
+                raise TypeIncorrectlySpecifiedError(s)
+            toks.append(punct or word)
+
+        return toks
+
+    def _fail(self):
+        raise TypeIncorrectlySpecifiedError(self.s)
+
+    def _peek(self):
+        return self.toks[self.pos] if self.pos < len(self.toks) else None
+
+    def _next(self):
+        tok = self._peek()
+        if tok is None:
+            self._fail()
+        self.pos += 1
+        return tok
+
+    def _expect(self, tok):
+        if self._next() != tok:
+            self._fail()
+
+    def _typ(self):
+        t = self._tight()
+
+        if self._peek() == '->':
+            self.pos += 1
+            return PType.arrow(t, self._typ())
+        else:
+            return t
+
+    def _tight(self):
+        tok = self._next()
+
+        if tok in _BASE_TYPES:
+            return _BASE_TYPES[tok]
+
+        elif tok[0] == "'":
+            return PType.var(tok)
+
+        elif tok == '[':
+            t = self._typ()
+            self._expect(']')
+            return PType.list(t)
+
+        elif tok == '(':
+            if self._peek() == ')':
+                self.pos += 1
+                return PType.tuple(())
+
+            t = self._typ()
+
+            # Just parentheses, not a tuple.
+            if self._peek() == ')':
+                self.pos += 1
+                return t
+
+            elts = [t]
+            while self._peek() == ',':
+                self.pos += 1
+                if self._peek() == ')':
+                    break
+                elts.append(self._typ())
+            self._expect(')')
+
+            return PType.tuple(elts)
+
+        else:
+            self._fail()
+
+_BASE_TYPES = {"int": PType.int(), "float": PType.float(),
+               "str": PType.string(), "unicode": PType.unicode(),
+               "bool": PType.bool(), "unit": PType.unit()}
+
+_VAR_RE = re.compile(r"'[a-zA-Z0-9]+\Z")
+
+# Matches the whitespace in a type spec, along with any punctuation it
+# surrounds. Whitespace only matters between two words.
+_SPEC_SPACE_RE = re.compile(r"\s*(->|[\[\](),])\s*|\s+")
+
+def _squeeze_space(m):
+    return m.group(1) or ' '
+
+# Memo of type spec strings to the types they parse to.
+spec_cache = LRUCache(TYPE_SPEC_CACHE_SIZE)
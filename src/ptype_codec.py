@@ -0,0 +1,230 @@
+from ptype import PType
+from errors import TypeSerializationError
+
+"""
+A compact, versioned binary encoding for PTypes, used to move types and type
+environments between processes or into on-disk caches without pickling deep
+object graphs.
+
+An encoding is the magic bytes `PT`, a format version byte, and a kind byte
+(`T` for a single type, `E` for an environment). Then comes a table of every
+distinct type node, children before parents. Each node is a tag byte followed
+by varint indices of its children in the table. Tuples have a varint length
+first, and variables store their identifier as a varint length plus UTF-8
+bytes. Types are interned, so a subterm shared anywhere in the encoded value is
+written once. The table is followed by the root index (for a type) or by
+varint-counted pairs of identifier and type index (for an environment).
+Decoding rebuilds types through the PType constructors, so they are interned
+again on load.
+"""
+
+MAGIC = b"PT"
+VERSION = 1
+
+_TYPE = ord("T")
+_ENV = ord("E")
+
+def dumps(t):
+    """Encode the PType `t` as a byte string."""
+
+    enc = _Encoder(_TYPE)
+    enc.varint(enc.node(t))
+    return enc.getvalue()
+
+def loads(data):
+    """Decode a PType from the byte string `data` produced by `dumps`."""
+
+    dec = _Decoder(data, _TYPE)
+    t = dec.ref()
+    dec.finish()
+    return t
+
+def dumps_env(env):
+    """
+    Encode the type environment `env`, a mapping of identifiers to PTypes, as
+    a byte string. Types are shared across the whole environment.
+    """
+
+    enc = _Encoder(_ENV)
+    items = sorted((k, enc.node(t)) for (k, t) in env.items())
+
+    enc.varint(len(items))
+    for (k, i) in items:
+        enc.string(k)
+        enc.varint(i)
+
+    return enc.getvalue()
+
+def loads_env(data):
+    """Decode a type environment dictionary produced by `dumps_env`."""
+
+    dec = _Decoder(data, _ENV)
+    env = {}
+
+    for _ in range(dec.varint()):
+        k = dec.string()
+        env[k] = dec.ref()
+
+    dec.finish()
+    return env
+
+
+class _Encoder(object):
+    """
+    Writes the header and node table of an encoding. Nodes are added with
+    `node`, and anything written afterwards forms the trailer.
+    """
+
+    def __init__(self, kind):
+        self.table = bytearray()
+        self.trailer = bytearray()
+        self.index = {}
+        self.kind = kind
+
+    def getvalue(self):
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        out.append(self.kind)
+        _write_varint(out, len(self.index))
+        return bytes(out + self.table + self.trailer)
+
+    def varint(self, n):
+        _write_varint(self.trailer, n)
+
+    def string(self, s):
+        _write_string(self.trailer, s)
+
+    def node(self, t):
+        """
+        Add `t` and all of its subterms to the table if they aren't there yet,
+        and return the index of `t`. Walks the type with an explicit stack so
+        deep types don't hit the recursion limit.
+        """
+
+        index = self.index
+        stack = [(t, False)]
+
+        while stack:
+            (u, expanded) = stack.pop()
+
+            if u in index:
+                continue
+
+            children = _children(u)
+
+            if expanded or not children:
+                self.table.append(u.tag)
+
+                if u.is_tuple():
+                    _write_varint(self.table, len(children))
+                if u.is_var():
+                    _write_string(self.table, u.idn)
+
+                for c in children:
+                    _write_varint(self.table, index[c])
+
+                index[u] = len(index)
+
+            else:
+                stack.append((u, True))
+                stack.extend((c, False) for c in reversed(children))
+
+        return index[t]
+
+
+class _Decoder(object):
+    """Reads an encoding's header and node table, then its trailer."""
+
+    def __init__(self, data, kind):
+        self.buf = bytearray(data)
+        self.pos = 0
+
+        if self.buf[:2] != bytearray(MAGIC):
+            raise TypeSerializationError("not an encoded PType")
+        if self.buf[2:3] != bytearray([VERSION]):
+            raise TypeSerializationError("unsupported encoding version")
+        if self.buf[3:4] != bytearray([kind]):
+            raise TypeSerializationError("wrong kind of encoding")
+
+        self.pos = 4
+        self.table = []
+
+        for _ in range(self.varint()):
+            self.table.append(self.node())
+
+    def finish(self):
+        if self.pos != len(self.buf):
+            raise TypeSerializationError("trailing bytes after encoding")
+
+    def byte(self):
+        if self.pos >= len(self.buf):
+            raise TypeSerializationError("truncated encoding")
+        b = self.buf[self.pos]
+        self.pos += 1
+        return b
+
+    def varint(self):
+        n = shift = 0
+        while True:
+            b = self.byte()
+            n |= (b & 0x7f) << shift
+            shift += 7
+            if not b & 0x80:
+                return n
+
+    def string(self):
+        n = self.varint()
+        if self.pos + n > len(self.buf):
+            raise TypeSerializationError("truncated encoding")
+        s = bytes(self.buf[self.pos:self.pos+n])
+        self.pos += n
+        return s
+
+    def ref(self):
+        i = self.varint()
+        if i >= len(self.table):
+            raise TypeSerializationError("bad type reference %d" % i)
+        return self.table[i]
+
+    def node(self):
+        tag = self.byte()
+
+        if tag <= PType.UNIT:
+            return PType((tag,))
+        elif tag == PType.LIST:
+            return PType.list(self.ref())
+        elif tag == PType.TUPLE:
+            return PType.tuple([self.ref() for _ in range(self.varint())])
+        elif tag == PType.ARROW:
+            return PType.arrow(self.ref(), self.ref())
+        elif tag == PType.VAR:
+            return PType.var(self.string())
+        elif tag == PType.UNIV:
+            return PType.univ(self.ref(), self.ref())
+        else:
+            raise TypeSerializationError("bad type tag %d" % tag)
+
+
+def _children(t):
+    if t.is_list():
+        return (t.elt,)
+    elif t.is_tuple():
+        return t.elts
+    elif t.is_arrow():
+        return (t.dom, t.ran)
+    elif t.is_univ():
+        return (t.qnt, t.ovr)
+    else:
+        return ()
+
+def _write_varint(buf, n):
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def _write_string(buf, s):
+    if isinstance(s, unicode):
+        s = s.encode('utf-8')
+    _write_varint(buf, len(s))
+    buf.extend(s)
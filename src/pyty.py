@@ -4,11 +4,13 @@ import sys
 from optparse import OptionParser, OptionGroup
 
 from logger import Logger
-from check import check_mod, check_expr
-from infer import infer_expr
-from ptype import PType
-from parse_file import parse_type_decs
-from ast_extensions import TypeDecASTModule
+from check import diagnose_mod, check_expr, expr_memo
+from infer import infer_expr, infer_memo
+from ptype import PType, spec_cache
+from parse_file import parse_source_file
+from util import format_stats, format_diagnostic
+from func_cache import FunctionCache
+from env import Env
 
 import check
 import parse_file
@@ -22,10 +24,16 @@ usage = "usage: %prog [options]\n\nDo not mix options from different modes."
 
 parser = OptionParser(usage=usage)
 
+parser.add_option("-s", "--stats", dest="stats", action="store_true",
+                  default=False, help="print cache statistics after the run")
+
 f_group = OptionGroup(parser, "File Mode",
                       "Use Pyty to typecheck source code files.")
 f_group.add_option("-f", "--file", dest="filename",
                    help="file to typecheck", metavar="FIL")
+f_group.add_option("-c", "--cache", dest="cache",
+                   help="file recording the functions known to typecheck, "
+                   "which are not checked again", metavar="FIL")
 parser.add_option_group(f_group)
 
 e_group = OptionGroup(parser, "Expression Mode",
@@ -46,21 +54,22 @@ parser.add_option_group(i_group)
 
 (opt, args) = parser.parse_args()
 
+fn_cache = FunctionCache(opt.cache) if opt.cache else None
+
 if opt.filename and not opt.expr and not opt.type and not opt.infer_expr:
     file_name = opt.filename
 
     try:
-        # FIXME: this is copied from unit_test_core, should be abstracted
-        # away somewhere, but don't know the best way to deal with logging.
-        with open(file_name, 'r') as f:
-            text = f.read()
-        untyped_ast = ast.parse(text)
-        typedecs = parse_type_decs(file_name)
-        typed_ast = TypeDecASTModule(untyped_ast, typedecs)
-        if check_mod(typed_ast.tree):
+        typed_ast = parse_source_file(file_name)
+        diagnostics = diagnose_mod(typed_ast, fn_cache)
+        if fn_cache:
+            fn_cache.save()
+        for d in diagnostics:
+            print format_diagnostic(d)
+        if not diagnostics:
             print "Typechecked correctly!"
         else:
-            print "Did not typecheck."
+            print "Did not typecheck: %d error(s)." % len(diagnostics)
 
     except IOError as e:
         print "File not found: %s" % e.filename
@@ -68,15 +77,22 @@ if opt.filename and not opt.expr and not opt.type and not opt.infer_expr:
 elif opt.expr and opt.type and not opt.filename and not opt.infer_expr:
     e = ast.parse(opt.expr).body[0].value
     t = PType.from_str(opt.type)
-    template = ("YES! -- %s typechecks as type %s" if check_expr(e, t, {}) else
+    template = ("YES! -- %s typechecks as type %s"
+                if check_expr(e, t, Env()) else
                 "NO! --- %s does not typecheck as type %s")
     print template % (opt.expr, t)
 
 elif opt.infer_expr and not opt.filename and not opt.expr and not opt.type:
     e = ast.parse(opt.infer_expr).body[0].value
-    print "%s -- is the inferred type of %s" % (infer_expr(e, {}),
+    print "%s -- is the inferred type of %s" % (infer_expr(e, Env()),
                                                 opt.infer_expr)
     
 else:
     parser.print_help()
 
+if opt.stats:
+    print format_stats("type spec cache", spec_cache.stats())
+    print format_stats("check_expr memo", expr_memo.stats())
+    print format_stats("infer_expr memo", infer_memo.stats())
+    if fn_cache:
+        print format_stats("function cache", fn_cache.stats())
@@ -18,6 +18,9 @@ SPEC_SUBDIR = "spec/"      # spec subdir lives in the test dir
 SPEC_EXPR_PREFIX = "expr_" # prefix for files specifying expr tests
 SPEC_MOD_PREFIX = "mod_"   # prefix for files specifying module tests
 
+TYPE_SPEC_CACHE_SIZE = 1024 # max number of parsed type specs kept by
+                            # PType.from_str
+
 FILE_DEBUG = True
 DEBUG_SUBJECT_FILE = "mod_while9.py"
 DEBUG_TYPEDEC_PARSING = True
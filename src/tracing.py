@@ -0,0 +1,118 @@
+import logging
+from timeit import default_timer
+from collections import namedtuple
+
+"""
+Structured tracing of the typechecker.
+
+When `enabled` is true, every statement checked, expression checked, and
+expression whose type is inferred produces a `TraceEvent`, which is passed to
+the current sink's `emit` method. Tracing is off by default, and the checker
+then only pays for testing `enabled` at each node.
+
+    tracing.enable(tracing.ListSink())
+    check_mod(tree)
+    events = tracing.sink.events
+    tracing.disable()
+"""
+
+# Whether tracing is on. Read directly by the checker on every node visit.
+enabled = False
+
+# Where events go while tracing is on.
+sink = None
+
+# Nesting depth of the rule currently running, counting from 0.
+_depth = 0
+
+"""
+One rule application:
+- `kind`: `"stmt"`, `"expr"`, or `"infer"`.
+- `node`: the AST node class name.
+- `lineno`: the node's line number, or `None` if it has none.
+- `type`: the PType the node was checked against (`None` for statements and
+    inference).
+- `rule`: the name of the function implementing the rule, or `None` if the
+    node is outside the language subset.
+- `result`: what the rule returned.
+- `duration`: seconds spent in the rule, including nested rules.
+- `depth`: how many rules were running when this one started.
+"""
+TraceEvent = namedtuple('TraceEvent', ['kind', 'node', 'lineno', 'type', 'rule',
+                                       'result', 'duration', 'depth'])
+
+def enable(new_sink):
+    """Start sending trace events to `new_sink`."""
+
+    global enabled, sink
+    sink = new_sink
+    enabled = True
+
+def disable():
+    """Stop tracing."""
+
+    global enabled, sink
+    enabled = False
+    sink = None
+
+def traced(kind, node, t, rule, args, unsupported):
+    """
+    Return `rule(*args)` for the AST node `node` (or `unsupported` if `rule` is
+    `None`), emitting a `TraceEvent` for it once it returns.
+    """
+
+    global _depth
+
+    depth = _depth
+    _depth += 1
+    start = default_timer()
+
+    try:
+        result = unsupported if rule is None else rule(*args)
+    finally:
+        _depth = depth
+
+    record(kind, node, t, rule, result, default_timer() - start, depth)
+    return result
+
+def record(kind, node, t, rule, result, duration, depth):
+    """
+    Emit a `TraceEvent` for the application of `rule` (or of no rule, if it is
+    `None`) to the AST node `node`, which was timed by the caller.
+    """
+
+    sink.emit(TraceEvent(kind, node.__class__.__name__,
+                         getattr(node, 'lineno', None), t,
+                         rule.__name__ if rule else None, result,
+                         duration, depth))
+
+
+class ListSink(object):
+    """Keeps every event, in the order emitted, in the list `events`."""
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+
+class LoggingSink(object):
+    """
+    Writes each event as one line to a `logging` logger, indented by its
+    depth. Events are emitted as rules return, so nested rules come first.
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger("pyty.trace")
+        self.level = level
+
+    def emit(self, e):
+        if not self.logger.isEnabledFor(self.level):
+            return
+
+        target = e.kind if e.type is None else "%s as %s" % (e.kind, e.type)
+        self.logger.log(self.level, "%s%s %s (line %s): %s -> %s [%.1f us]",
+                        "  " * e.depth, e.node, target, e.lineno,
+                        e.rule or "unsupported", e.result,
+                        e.duration * 1e6)
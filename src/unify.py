@@ -0,0 +1,208 @@
+import itertools
+
+from ptype import PType
+
+"""
+Unification of PTypes, used to apply polymorphic functions.
+
+A `Substitution` solves equations between types over a set of *flexible* type
+variables, the fresh variables made when a universally quantified type is
+instantiated. Any other type variable (such as one a user wrote in a function's
+declared type) is rigid and only unifies with itself or with a flexible
+variable.
+
+Flexible variables are kept in a union-find forest with path compression and
+union by rank. Each class's root may be bound to a non-variable type, which
+stands for every variable in the class. Binding a variable performs an occurs
+check, so solutions are always finite types.
+"""
+
+# Source of unique names for fresh type variables. Users can't write these
+# names, since type spec variables have no underscores.
+_fresh_ids = itertools.count()
+
+def fresh_var():
+    """Return a type variable that occurs in no other type."""
+
+    return PType.var("'_%d" % next(_fresh_ids))
+
+
+class Substitution(object):
+
+    def __init__(self):
+        self.flexible = set()
+        self.parent = {}
+        self.rank = {}
+        self.binding = {}
+
+    def instantiate(self, t):
+        """
+        Strip the outer universal quantifiers from `t`, replacing each
+        quantified variable with a fresh flexible variable.
+        """
+
+        renaming = {}
+
+        while t.is_univ():
+            v = fresh_var()
+            self.flexible.add(v)
+            renaming[t.qnt] = v
+            t = t.ovr
+
+        return _rename(t, renaming) if renaming else t
+
+    def find(self, v):
+        """Return the root of flexible variable `v`'s class."""
+
+        root = v
+        while root in self.parent:
+            root = self.parent[root]
+
+        # Path compression.
+        while v is not root:
+            up = self.parent[v]
+            self.parent[v] = root
+            v = up
+
+        return root
+
+    def resolve(self, t):
+        """
+        Return what `t` stands for at the top level: the binding of its class
+        if `t` is a bound flexible variable, the class root if `t` is an
+        unbound one, and `t` itself otherwise.
+        """
+
+        if t in self.flexible:
+            root = self.find(t)
+            return self.binding.get(root, root)
+        else:
+            return t
+
+    def apply(self, t):
+        """Return `t` with every solved flexible variable substituted."""
+
+        if not self.flexible.intersection(t.free_type_vars()):
+            return t
+
+        if t.is_var():
+            u = self.resolve(t)
+            return u if u is t else self.apply(u)
+        elif t.is_list():
+            return PType.list(self.apply(t.elt))
+        elif t.is_tuple():
+            return PType.tuple([self.apply(elt) for elt in t.elts])
+        elif t.is_arrow():
+            return PType.arrow(self.apply(t.dom), self.apply(t.ran))
+        elif t.is_univ():
+            return PType.univ(t.qnt, self.apply(t.ovr))
+        else:
+            return t
+
+    def has_flexible(self, t):
+        """Determine whether `t` mentions an unsolved flexible variable."""
+
+        return bool(self.flexible.intersection(self.apply(t).free_type_vars()))
+
+    def unify(self, t0, t1):
+        """
+        Extend this substitution so that `t0` and `t1` become equal. Returns
+        whether that is possible; if not, the substitution may be partially
+        extended and should be discarded.
+        """
+
+        work = [(t0, t1)]
+
+        while work:
+            (a, b) = work.pop()
+            a = self.resolve(a)
+            b = self.resolve(b)
+
+            if a is b:
+                continue
+            elif a in self.flexible:
+                if not self._bind(a, b):
+                    return False
+            elif b in self.flexible:
+                if not self._bind(b, a):
+                    return False
+
+            elif a.tag != b.tag:
+                return False
+            elif a.is_list():
+                work.append((a.elt, b.elt))
+            elif a.is_tuple():
+                if a.tuple_len() != b.tuple_len():
+                    return False
+                work.extend(zip(a.elts, b.elts))
+            elif a.is_arrow():
+                work.append((a.dom, b.dom))
+                work.append((a.ran, b.ran))
+
+            else:
+                # Distinct base types, rigid variables, or quantified types.
+                return False
+
+        return True
+
+    def _bind(self, v, t):
+        """
+        Make unbound root `v` stand for `t`, which is an unbound root itself or
+        a type that isn't a flexible variable.
+        """
+
+        if t in self.flexible:
+            # Union by rank.
+            (rv, rt) = (self.rank.get(v, 0), self.rank.get(t, 0))
+            if rv < rt:
+                (v, t) = (t, v)
+            elif rv == rt:
+                self.rank[v] = rv + 1
+            self.parent[t] = v
+            return True
+
+        elif self._occurs(v, t):
+            return False
+
+        else:
+            self.binding[v] = t
+            return True
+
+    def _occurs(self, v, t):
+        """Determine whether root `v` occurs in `t` under this substitution."""
+
+        seen = set()
+        work = [t]
+
+        while work:
+            for u in work.pop().free_type_vars():
+                if u in self.flexible and u not in seen:
+                    seen.add(u)
+                    root = self.find(u)
+                    if root is v:
+                        return True
+                    if root in self.binding:
+                        work.append(self.binding[root])
+
+        return False
+
+
+def _rename(t, renaming):
+    """Replace the type variables in `t` according to the dict `renaming`."""
+
+    if not t.free_type_vars().intersection(renaming):
+        return t
+    elif t.is_var():
+        return renaming[t]
+    elif t.is_list():
+        return PType.list(_rename(t.elt, renaming))
+    elif t.is_tuple():
+        return PType.tuple([_rename(elt, renaming) for elt in t.elts])
+    elif t.is_arrow():
+        return PType.arrow(_rename(t.dom, renaming), _rename(t.ran, renaming))
+    elif t.is_univ():
+        inner = dict(renaming)
+        inner.pop(t.qnt, None)
+        return PType.univ(t.qnt, _rename(t.ovr, inner))
+    else:
+        return t
@@ -1,6 +1,7 @@
 import ast
 import math
 import logging
+from collections import OrderedDict
 from datetime import datetime
 
 """
@@ -44,6 +45,142 @@ def cname(obj):
     else:
         return obj.__class__.__name__
 
+### Caching
+
+class LRUCache(object):
+    """
+    A mapping bounded to `capacity` entries which evicts the least recently
+    used entry when full. Keeps counts of hits, misses, and evictions so the
+    capacity can be tuned; see `stats`.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for `key`, marking it most recently used, or
+        `default` if `key` is not cached.
+        """
+
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Cache `value` for `key`, evicting old entries if over capacity."""
+
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        self._evict()
+
+    def resize(self, capacity):
+        """Change the capacity, evicting old entries if it shrank."""
+
+        self.capacity = capacity
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        """Return a dictionary of the cache's size and counters."""
+
+        return {"capacity": self.capacity, "size": len(self._entries),
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions}
+
+    def _evict(self):
+        while len(self._entries) > max(self.capacity, 0):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+class MemoTable(object):
+    """
+    An unbounded mapping for memoizing results within one run. Runs may nest,
+    as `begin_run` and `end_run` calls, and the table empties itself when the
+    outermost run ends, so it never outlives the nodes of one run. Keeps counts
+    of hits and misses; see `stats`.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._runs = 0
+        self.reset_stats()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """Return the value stored for `key`, or `default` if there is none."""
+
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+
+    def clear(self):
+        self._entries.clear()
+
+    def begin_run(self):
+        self._runs += 1
+
+    def end_run(self):
+        """End a run, emptying the table if it was the outermost one."""
+
+        self._runs -= 1
+        if not self._runs:
+            self._entries.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Return a dictionary of the table's size and counters."""
+
+        return {"size": len(self._entries), "hits": self.hits,
+                "misses": self.misses}
+
+def format_stats(name, stats):
+    """Render the dictionary `stats` of a cache called `name` as a line."""
+
+    return "%s: %s" % (name, ", ".join("%s=%s" % (k, stats[k])
+                                       for k in sorted(stats)))
+
+def format_diagnostic(d):
+    """Render the `engine.Diagnostic` `d` as a line."""
+
+    s = "line %s, col %s: %s %s" % (d.lineno, d.col_offset, d.node, d.message)
+    if d.inferred is not None:
+        s += " (inferred %s)" % d.inferred
+    if d.rule:
+        s += " [%s]" % d.rule
+    return s
+
 ### Set operations
 
 def disjoint_sum(union, sets):
@@ -74,6 +211,12 @@ def disjoint_sum(union, sets):
 
     return u == union
 
+def ast_node_classes():
+    """Returns a list of all the AST node classes in the `ast` module."""
+
+    return [c for c in vars(ast).values()
+            if isinstance(c, type) and issubclass(c, ast.AST)]
+
 ### Operations used for inference and checking
 
 def node_is_None(node):
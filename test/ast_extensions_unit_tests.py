@@ -0,0 +1,125 @@
+import ast
+import sys
+import unittest
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+from ast_extensions import (TypeDec, TypeDecASTModule, SpanIndex,
+                            place_typedecs)
+
+def typedec(idn, line):
+    return TypeDec([ast.Name(idn, ast.Store())], "int", line)
+
+def shape(stmts, table=None):
+    """
+    Describe the statement list `stmts`, with its type declarations in `table`
+    (if any), as a list of the class names of its statements, with the
+    statement lists of compound statements nested.
+    """
+
+    out = []
+    for stmt in (table.merged(stmts) if table else stmts):
+        if stmt.__class__ is TypeDec:
+            out.append(stmt.targets[0].id)
+        else:
+            out.append(stmt.__class__.__name__)
+            out.extend(shape(l, table) for l in stmt.stmt_lists())
+    return out
+
+class PlacementTests(unittest.TestCase):
+
+    def test_nested(self):
+        src = ("x = 1\n"        # 1
+               "if x:\n"        # 2
+               "    y = 2\n"    # 3
+               "\n"             # 4
+               "    z = 3\n"    # 5
+               "else:\n"        # 6
+               "    pass\n"     # 7
+               "w = 4\n")       # 8
+        tdecs = [typedec(i, l) for (i, l) in
+                 [("a", 9), ("b", 1), ("c", 4), ("d", 6), ("e", 2)]]
+        typed = TypeDecASTModule(ast.parse(src), tdecs)
+        placed = ["b", "Assign", "e", "If",
+                  ["Assign", "c", "Assign"], ["d", "Pass"],
+                  "Assign", "a"]
+
+        self.assertEqual( shape(typed.tree.body, typed.table), placed )
+
+        # The view leaves the module alone, and placing the declarations in it
+        # gives the same statement lists.
+        self.assertEqual( ast.dump(typed.tree), ast.dump(ast.parse(src)) )
+        place_typedecs(typed.tree, tdecs)
+        self.assertEqual( shape(typed.tree.body), placed )
+
+    def test_same_line(self):
+        tdecs = [typedec("a", 1), typedec("b", 1)]
+        typed = TypeDecASTModule(ast.parse("x = 1\n"), tdecs)
+
+        # As if placed one at a time, each before the statements on its line.
+        self.assertEqual( shape(typed.tree.body, typed.table),
+                          ["b", "a", "Assign"] )
+
+    def test_many(self):
+        n = 20000
+        src = "if x:\n    y = 1\n    z = 2\n" * n
+        tdecs = [typedec("t%d" % i, 3 * i + 2) for i in range(n)]
+        typed = TypeDecASTModule(ast.parse(src), tdecs)
+
+        self.assertEqual( len(typed.table.merged(typed.tree.body)), n )
+        self.assertEqual( shape(typed.tree.body[:2], typed.table),
+                          ["If", ["t0", "Assign", "Assign"], [],
+                           "If", ["t1", "Assign", "Assign"], []] )
+
+class SpanIndexTests(unittest.TestCase):
+
+    def test_spans(self):
+        src = ("if a:\n"           # 1
+               "    b = 1\n"       # 2
+               "else:\n"           # 3
+               "    while c:\n"    # 4
+               "        f(c)\n"    # 5
+               "try:\n"            # 6
+               "    pass\n"        # 7
+               "except E:\n"       # 8
+               "    g = 1\n"       # 9
+               "else:\n"           # 10
+               "    h = 2\n"       # 11
+               "for i in j: k = i\n")  # 12
+        mod = ast.parse(src)
+        spans = SpanIndex(mod)
+
+        self.assertEqual( [stmt.__class__.__name__ for stmt in spans.stmts],
+                          ["If", "Assign", "While", "Expr", "TryExcept",
+                           "Pass", "Assign", "Assign", "For", "Assign"] )
+        self.assertEqual( zip(spans.first, spans.last),
+                          [(1, 5), (2, 2), (4, 5), (5, 5), (6, 11), (7, 7),
+                           (9, 9), (11, 11), (12, 12), (12, 12)] )
+        self.assertEqual( spans.parent, [-1, 0, 0, 2, -1, 4, 4, 4, -1, 8] )
+
+        # (last_lineno doesn't know of expression statements like f(c).)
+        for stmt in mod.body[1:]:
+            self.assertEqual( spans.last_lineno(stmt), stmt.last_lineno() )
+
+    def test_stmt_at(self):
+        src = ("x = 1\n"          # 1
+               "\n"               # 2
+               "def f(y):\n"      # 3
+               "    if y:\n"      # 4
+               "        z = 2\n"  # 5
+               "\n"               # 6
+               "    return y\n"   # 7
+               "w = 3\n")         # 8
+        mod = ast.parse(src)
+        spans = SpanIndex(mod)
+        (f, fif) = (mod.body[1], mod.body[1].body[0])
+
+        self.assertEqual( spans.span(f), (3, 7) )
+        self.assertEqual( [spans.stmt_at(l) for l in range(9)],
+                          [None, mod.body[0], None, f, fif, fif.body[0], f,
+                           f.body[1], mod.body[2]] )
+
+
+if __name__ == '__main__':
+    unittest.main()
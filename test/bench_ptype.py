@@ -0,0 +1,204 @@
+import gc
+import sys
+import json
+import time
+import platform
+import itertools
+from optparse import OptionParser
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+import ptype
+from ptype import PType
+
+"""
+Microbenchmarks for the ptype module. Each operation is timed over generated
+types of controlled size: right-nested arrows of a given depth, tuples of a
+given width, and lists nested to a given depth. Run from the test directory:
+
+    python bench_ptype.py [-d DEPTH] [-w WIDTH] [-o out.json]
+                          [-b baseline.json [-t THRESHOLD]]
+
+Results are the best time per call, in microseconds, and can be written as
+JSON along with a fingerprint of the machine. When a baseline file is given,
+any metric slower than the baseline by more than the threshold fraction is
+reported, and the script exits with status 1.
+"""
+
+int_t = PType.int()
+
+# Fresh variable names, so "cold" benchmarks time types nothing has seen.
+_fresh = itertools.count()
+
+def deep_arrow(depth, leaf):
+    t = leaf
+    for i in range(depth):
+        t = PType.arrow(int_t, t)
+    return t
+
+def wide_tuple(width, leaf):
+    return PType.tuple([leaf] + [int_t] * (width - 1))
+
+def nested_list(depth, leaf):
+    t = leaf
+    for i in range(depth):
+        t = PType.list(t)
+    return t
+
+def fresh_var():
+    return PType.var("'v%d" % next(_fresh))
+
+def best(fn, arg, number, repeat):
+    """Return the best time, in seconds, of `number` calls of `fn(arg)`."""
+
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        for j in xrange(number):
+            fn(arg)
+        times.append((time.time() - start) / number)
+    return min(times)
+
+def best_cold(make, fn, repeat):
+    """
+    Return the best time, in seconds, of calling `fn` once on a value newly
+    built by `make` (which is not timed).
+    """
+
+    times = []
+    for i in range(repeat):
+        x = make()
+        start = time.time()
+        fn(x)
+        times.append(time.time() - start)
+    return min(times)
+
+def uncached_from_str(s):
+    ptype.spec_cache.clear()
+    return PType.from_str(s)
+
+def run(depth, width, number, repeat):
+    """Run every benchmark and return a dictionary of metric -> seconds."""
+
+    shapes = {
+        "deep_arrow": lambda leaf: deep_arrow(depth, leaf),
+        "wide_tuple": lambda leaf: wide_tuple(width, leaf),
+        "nested_list": lambda leaf: nested_list(depth, leaf),
+    }
+
+    results = {}
+
+    for (name, make) in sorted(shapes.items()):
+        t = make(PType.var("'a"))
+        other = make(PType.var("'b"))
+        spec = repr(t)
+
+        def metric(op, seconds):
+            results["%s.%s" % (name, op)] = seconds
+
+        metric("construct", best_cold(lambda: None,
+                                      lambda _: make(fresh_var()), repeat))
+        metric("from_str", best(uncached_from_str, spec, number, repeat))
+        metric("from_str_cached", best(PType.from_str, spec, number, repeat))
+        metric("eq", best(lambda u: u == t, make(PType.var("'a")),
+                          number, repeat))
+        metric("ne", best(lambda u: u == t, other, number, repeat))
+        metric("hash", best(hash, t, number, repeat))
+        metric("repr", best(repr, t, number, repeat))
+        metric("free_type_vars", best_cold(lambda: make(fresh_var()),
+                                           PType.free_type_vars, repeat))
+        metric("free_type_vars_cached", best(PType.free_type_vars, t,
+                                             number, repeat))
+        metric("quantify", best_cold(lambda: make(fresh_var()),
+                                     PType.quantify, repeat))
+        metric("quantify_cached", best(PType.quantify, t, number, repeat))
+
+    t = wide_tuple(width, PType.var("'a"))
+    n = t.tuple_len()
+    results["wide_tuple.tuple_slice_all_splits"] = best(
+        lambda u: [(u.tuple_slice(0, m), u.tuple_slice(m)) for m in range(n)],
+        t, 1, repeat)
+    results["wide_tuple.tuple_slice_hash"] = best_cold(
+        lambda: wide_tuple(width, fresh_var()).tuple_slice(1), hash, repeat)
+
+    return results
+
+def fingerprint():
+    """Describe the machine and interpreter the benchmarks ran on."""
+
+    return {"machine": platform.machine(),
+            "processor": platform.processor(),
+            "system": platform.system(),
+            "release": platform.release(),
+            "node": platform.node(),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation()}
+
+def regressions(results, baseline, threshold):
+    """
+    Return a list of (metric, baseline seconds, seconds) for every metric more
+    than `threshold` (a fraction) slower than in `baseline`.
+    """
+
+    slow = []
+    for (k, old) in sorted(baseline.items()):
+        if k in results and results[k] > old * (1 + threshold):
+            slow.append((k, old, results[k]))
+    return slow
+
+if __name__ == '__main__':
+    parser = OptionParser(usage="usage: %prog [options]")
+    parser.add_option("-d", "--depth", dest="depth", type="int", default=200,
+                      help="nesting depth of arrows and lists [%default]")
+    parser.add_option("-w", "--width", dest="width", type="int", default=1000,
+                      help="number of tuple elements [%default]")
+    parser.add_option("-n", "--number", dest="number", type="int",
+                      default=100, help="calls per timing [%default]")
+    parser.add_option("-r", "--repeat", dest="repeat", type="int", default=5,
+                      help="timings per metric; the best is kept [%default]")
+    parser.add_option("-o", "--output", dest="output", metavar="FILE",
+                      help="write results as JSON to FILE")
+    parser.add_option("-b", "--baseline", dest="baseline", metavar="FILE",
+                      help="compare against JSON results in FILE")
+    parser.add_option("-t", "--threshold", dest="threshold", type="float",
+                      default=0.25, help="allowed slowdown against the "
+                      "baseline, as a fraction [%default]")
+    (opt, args) = parser.parse_args()
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * opt.depth))
+
+    gc.disable()
+    results = run(opt.depth, opt.width, opt.number, opt.repeat)
+    gc.enable()
+
+    report = {"fingerprint": fingerprint(),
+              "params": {"depth": opt.depth, "width": opt.width,
+                         "number": opt.number, "repeat": opt.repeat},
+              "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "results": results}
+
+    for k in sorted(results):
+        print "%-45s %12.3f us" % (k, results[k] * 1e6)
+
+    if opt.output:
+        with open(opt.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if opt.baseline:
+        with open(opt.baseline, 'r') as f:
+            base = json.load(f)
+
+        if base["fingerprint"] != report["fingerprint"]:
+            print "warning: baseline was recorded on a different machine"
+        if base["params"] != report["params"]:
+            print "warning: baseline was recorded with different parameters"
+
+        slow = regressions(results, base["results"], opt.threshold)
+
+        for (k, old, new) in slow:
+            print "REGRESSION %s: %.3f us -> %.3f us (%+.0f%%)" % \
+                  (k, old * 1e6, new * 1e6, (new / old - 1) * 100)
+
+        if slow:
+            sys.exit(1)
@@ -0,0 +1,82 @@
+import os
+import re
+import sys
+import timeit
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+from settings import SPEC_SUBDIR
+from ptype import TypeSpecParser
+from lepl_parser import LEPLTypeSpecParser, from_type_ast
+from errors import TypeIncorrectlySpecifiedError
+
+"""
+Compares the hand-written type spec parser in ptype.py against the LEPL
+grammar it replaced. The corpus is every type declared in a `#:` comment in the
+test specs. Run from the test directory:
+
+    python bench_type_spec.py [rounds]
+"""
+
+_TYPEDEC_REGEX = re.compile(r".*#:\s*[a-zA-Z]\w*\s*:\s*(?P<t>.*)")
+
+def load_corpus():
+    """
+    Return the list of type specs declared in the spec files. Some specs test
+    malformed declarations; those are checked to be rejected by both parsers
+    and left out.
+    """
+
+    specs = []
+
+    for file_name in sorted(os.listdir(SPEC_SUBDIR)):
+        if file_name.endswith('.spec'):
+            with open(SPEC_SUBDIR + file_name, 'r') as f:
+                for line in f:
+                    m = _TYPEDEC_REGEX.match(line)
+                    if m:
+                        specs.append(m.group('t').split('#')[0].strip())
+
+    valid = []
+
+    for s in specs:
+        try:
+            t = lepl_parse(s)
+        except TypeIncorrectlySpecifiedError:
+            try:
+                TypeSpecParser.parse(s)
+                assert False, "hand-written parser accepts " + s
+            except TypeIncorrectlySpecifiedError:
+                continue
+
+        assert TypeSpecParser.parse(s) is t, s
+        valid.append(s)
+
+    return valid
+
+def lepl_parse(s):
+    return from_type_ast(LEPLTypeSpecParser.parse(s))
+
+def time_parser(parse, specs, rounds):
+    """Return the best time, in seconds, to parse all of `specs` once."""
+
+    def run():
+        for s in specs:
+            parse(s)
+
+    return min(timeit.repeat(run, number=1, repeat=rounds))
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    specs = load_corpus()
+
+    new = time_parser(TypeSpecParser.parse, specs, rounds)
+    old = time_parser(lepl_parse, specs, rounds)
+
+    print "%d type specs (%d distinct), best of %d rounds" % \
+          (len(specs), len(set(specs)), rounds)
+    print "  LEPL grammar:   %8.2f us/spec" % (old / len(specs) * 1e6)
+    print "  hand-written:   %8.2f us/spec" % (new / len(specs) * 1e6)
+    print "  speedup:        %8.1fx" % (old / new)
@@ -0,0 +1,223 @@
+import ast
+import sys
+import random
+import unittest
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+from ast_extensions import TypeDec
+from check import (check_mod, check_expr, expr_rules, register_expr_rule,
+                   stmt_rules, expr_memo)
+from env import Env
+from infer import infer_expr
+from ptype import PType
+from errors import TypeMultiSpecifiedError, TypeUnspecifiedError
+from logger import Logger
+
+import check
+import infer
+
+check.log = infer.log = Logger()
+
+def typed_module(src, decs):
+    """
+    Parse `src` and put a `TypeDec` from `decs`, a dict from line numbers to
+    (identifier, type spec) pairs, before the statement on each such line.
+    """
+
+    mod = ast.parse(src)
+    body = []
+
+    for stmt in mod.body:
+        if stmt.lineno in decs:
+            (idn, spec) = decs[stmt.lineno]
+            body.append(TypeDec([ast.Name(idn, ast.Store())], spec,
+                                stmt.lineno))
+        body.append(stmt)
+
+    mod.body = body
+    return mod
+
+class CheckStmtListTests(unittest.TestCase):
+
+    def test_long_module(self):
+        # Far more statements than the recursion limit.
+        n = 100000
+        src = "x = 0\n" + "x = 1\n" * (n - 1)
+
+        self.assertTrue( check_mod(typed_module(src, {1: ("x", "int")})) )
+        self.assertFalse( check_mod(typed_module(src[:6000] + "x = 1.0\n",
+                                                 {1: ("x", "int")})) )
+
+    def test_long_module_of_declarations(self):
+        n = 20000
+        src = "".join("x%d = %d\n" % (i, i) for i in range(n))
+        decs = dict((i + 1, ("x%d" % i, "int")) for i in range(n))
+
+        self.assertTrue( check_mod(typed_module(src, decs)) )
+
+        decs[n] = ("x%d" % (n - 1), "float")
+        self.assertFalse( check_mod(typed_module(src, decs)) )
+
+    def test_redeclaration(self):
+        src = "x = 0\nx = 1\n"
+
+        self.assertTrue( check_mod(typed_module(src, {1: ("x", "int"),
+                                                      2: ("x", "int")})) )
+        self.assertRaises( TypeMultiSpecifiedError, check_mod,
+                           typed_module(src, {1: ("x", "int"),
+                                              2: ("x", "float")}) )
+
+    def test_trailing_declaration(self):
+        self.assertTrue( check_mod(typed_module("x = 0\n",
+                                                {1: ("x", "int")})) )
+
+        mod = typed_module("x = 0\n", {1: ("x", "int")})
+        mod.body.append(TypeDec([ast.Name("y", ast.Store())], "int", 2))
+        self.assertTrue( check_mod(mod) )
+
+class MemoTests(unittest.TestCase):
+
+    def setUp(self):
+        expr_memo.clear()
+        expr_memo.reset_stats()
+
+    def test_tuple_concatenation_chain(self):
+        # Function calls hide the operands' lengths, so Tup-Cat tries every
+        # split of every prefix of the chain.
+        n = 40
+        src = ("def f(x):\n    return (x,)\n" +
+               "t = " + " + ".join(["f(1)"] * n) + "\n")
+        decs = {1: ("f", "int -> (int,)"),
+                3: ("t", "(%s)" % ", ".join(["int"] * n))}
+
+        self.assertTrue( check_mod(typed_module(src, decs)) )
+        self.assertTrue( expr_memo.hits > 0 )
+        self.assertEqual( len(expr_memo), 0 )
+
+        decs[3] = ("t", "(%s)" % ", ".join(["int"] * (n + 1)))
+        self.assertFalse( check_mod(typed_module(src, decs)) )
+
+    def test_environments(self):
+        e = ast.parse("x").body[0].value
+        env0 = Env({"x": PType.int()})
+        env1 = env0.extend("x", PType.float())
+
+        # Results are kept for the rest of the outermost run.
+        expr_memo.begin_run()
+        try:
+            self.assertTrue( check_expr(e, PType.int(), env0) )
+            self.assertFalse( check_expr(e, PType.int(), env1) )
+            self.assertTrue( check_expr(e, PType.int(), env0) )
+            self.assertEqual( (expr_memo.hits, expr_memo.misses), (1, 2) )
+        finally:
+            expr_memo.end_run()
+
+        self.assertEqual( len(expr_memo), 0 )
+        self.assertTrue( check_expr(e, PType.int(), env0) )
+        self.assertEqual( len(expr_memo), 0 )
+
+        # Plain dictionaries can change, so they aren't memoized.
+        d = {"x": PType.int()}
+        self.assertTrue( check_expr(e, PType.int(), d) )
+        d["x"] = PType.float()
+        self.assertFalse( check_expr(e, PType.int(), d) )
+
+class TupCatTests(unittest.TestCase):
+
+    def test_long_chain(self):
+        n = 100
+        env = Env({"p": PType.from_str("(int, float)")})
+        e = ast.parse(" + ".join(["p", "(1,)"] * n)).body[0].value
+        t = PType.tuple([PType.int(), PType.float(), PType.int()] * n)
+
+        self.assertTrue( check_expr(e, t, env) )
+        self.assertFalse( check_expr(e, t.tuple_slice(1), env) )
+
+    def test_against_search(self):
+        # Length-directed splitting must agree with trying every split.
+        rand = random.Random(0)
+        env = Env({"p": PType.from_str("(int, float)"),
+                   "q": PType.from_str("(int,)"),
+                   "l": PType.from_str("[int]"),
+                   "f": PType.from_str("int -> (int, int)")})
+        operands = ["p", "q", "l", "()", "(1,)", "(1, 2.0)", "f(1)", "p[1:]",
+                    "(p + q)", "undeclared"]
+        types = [PType.from_str(s) for s in
+                 ["(int,)", "(int, float)", "(int, int)", "(int, float, int)",
+                  "(int, int, int)", "(int, float, int, int)", "()"]]
+
+        def searching(e0, e1, n, env):
+            return range(n)
+
+        for i in range(300):
+            src = " + ".join(rand.choice(operands)
+                             for j in range(rand.randint(2, 4)))
+            e = ast.parse(src).body[0].value
+            t = rand.choice(types)
+
+            results = []
+            for splits in [check._tup_cat_splits, searching]:
+                expr_memo.clear()
+                saved = check._tup_cat_splits
+                check._tup_cat_splits = splits
+                try:
+                    results.append(check_expr(e, t, env))
+                except TypeUnspecifiedError:
+                    results.append(TypeUnspecifiedError)
+                finally:
+                    check._tup_cat_splits = saved
+
+            # Splits that can't succeed aren't checked, so an undeclared
+            # identifier in them goes unreported.
+            if results[1] is TypeUnspecifiedError and results[0] is False:
+                continue
+
+            self.assertEqual( results[0], results[1],
+                              "%s as %s" % (src, t) )
+
+class DispatchTests(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_rules = dict(expr_rules)
+
+    def tearDown(self):
+        expr_rules.clear()
+        expr_rules.update(self.saved_rules)
+
+    def test_tables(self):
+        self.assertTrue( ast.Assign in stmt_rules )
+        self.assertTrue( ast.Num in expr_rules )
+        self.assertFalse( ast.Dict in expr_rules )
+
+        # Registration leaves nothing behind in the modules' namespaces.
+        for module in (check, infer):
+            self.assertFalse( hasattr(module, "node_class") )
+
+    def test_unsupported(self):
+        e = ast.parse("{1: 2}").body[0].value
+
+        self.assertIs( check_expr(e, PType.int(), Env()), False )
+        self.assertIs( infer_expr(e, Env()), None )
+        self.assertFalse( check_mod(typed_module("x = {1: 2}\n",
+                                                 {1: ("x", "int")})) )
+
+    def test_register(self):
+        e = ast.parse("{1: 2}").body[0].value
+        register_expr_rule(ast.Dict, lambda e, t, env: t == PType.int())
+
+        self.assertTrue( check_expr(e, PType.int(), Env()) )
+        self.assertFalse( check_expr(e, PType.float(), Env()) )
+
+    def test_rule_errors_propagate(self):
+        def rule(e, t, env):
+            return {}["missing"]
+        register_expr_rule(ast.Num, rule)
+
+        self.assertRaises( KeyError, check_expr, ast.Num(1), PType.int(),
+                           Env() )
+
+
+if __name__ == '__main__':
+    unittest.main()
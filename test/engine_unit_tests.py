@@ -0,0 +1,146 @@
+import ast
+import sys
+import unittest
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+from check import check_mod, diagnose_mod, expr_goal, STMT, EXPR, DECL
+from engine import compile_module, run, discharge
+from env import Env
+from errors import TypeUnspecifiedError
+from parse_file import parse_source
+from ptype import PType
+from logger import Logger
+
+import check
+import infer
+import parse_file
+
+check.log = infer.log = parse_file.log = Logger()
+
+int_t = PType.int()
+
+class CompileTests(unittest.TestCase):
+
+    def test_obligations(self):
+        mod = parse_source("x = 1  #: x : int\n"
+                           "print x\n"
+                           "y = x  #: y : float\n")
+        prog = compile_module(mod)
+
+        self.assertEqual( [o[0] for o in prog.obligations],
+                          [DECL, EXPR, STMT, DECL, EXPR] )
+
+        # Each obligation's environment has the declarations before it.
+        envs = [prog.envs[o[3]] for o in prog.obligations]
+        self.assertEqual( [len(e) for e in envs], [0, 0, 1, 1, 1] )
+
+        (kind, n, t, e) = prog.obligations[4]
+        self.assertIs( prog.nodes[n], mod.tree.body[2].value )
+        self.assertEqual( t, PType.float() )
+        self.assertEqual( prog.goal(4),
+                          (kind, prog.nodes[n], t, envs[4], mod.table) )
+
+    def test_table(self):
+        mod = parse_source("if True:\n"
+                           "    x = 1  #: x : int\n"
+                           "    while x > 0:\n"
+                           "        y = x  #: y : int\n"
+                           "        x = y\n"
+                           "    x = 2\n")
+        (stmt, env) = (mod.tree.body[0], Env())
+
+        # Nested statement lists find their declarations without the engine
+        # running the module.
+        self.assertTrue( check.check_stmt_list(mod.tree.body, env, mod.table) )
+        self.assertTrue( check.check_stmt(stmt, env, mod.table) )
+        self.assertRaises( TypeUnspecifiedError, check.check_stmt, stmt, env )
+
+    def test_run(self):
+        for src in ["x = 1  #: x : int\ny = x  #: y : int\n",
+                    "x = 1  #: x : int\ny = x  #: y : float\n",
+                    "x = 1  #: x : int\nx = 1.5\n"]:
+            mod = parse_source(src)
+            self.assertEqual( run(compile_module(mod)), check_mod(mod) )
+
+class DischargeTests(unittest.TestCase):
+
+    def test_deep_expression(self):
+        # Far deeper than the recursion limit allows a recursive checker.
+        depth = 5 * sys.getrecursionlimit()
+        e = ast.parse("1" + "+1" * depth, mode="eval").body
+
+        self.assertTrue( discharge(expr_goal(e, int_t, Env())) )
+        self.assertFalse( discharge(expr_goal(e, PType.list(int_t), Env())) )
+
+    def test_deep_module(self):
+        depth = 5 * sys.getrecursionlimit()
+        mod = parse_source("x = 1  #: x : int\n"
+                           "y = x" + " - x" * depth + "  #: y : int\n")
+
+        self.assertTrue( check_mod(mod) )
+
+class DiagnoseTests(unittest.TestCase):
+
+    def test_typechecks(self):
+        mod = parse_source("x = 1  #: x : int\nprint x\n")
+        self.assertEqual( diagnose_mod(mod), [] )
+
+    def test_innermost(self):
+        mod = parse_source("x = 1 + 1.5  #: x : int\n")
+        [d] = diagnose_mod(mod)
+
+        self.assertEqual( (d.lineno, d.col_offset, d.node), (1, 8, "Num") )
+        self.assertEqual( d.rule, "_check_Num_expr" )
+        self.assertEqual( d.expected, int_t )
+        self.assertEqual( d.inferred, PType.float() )
+
+    def test_alternatives(self):
+        # A rule which tries several alternatives takes the blame itself.
+        for (src, node) in [("x = 1 < 'a'  #: x : bool\n", "Compare"),
+                            ("x = 'a' * 1.5  #: x : str\n", "BinOp"),
+                            ("x = 1.5  #: x : int\n", "Num")]:
+            [d] = diagnose_mod(parse_source(src))
+            self.assertEqual( (d.node, d.col_offset), (node, 4) )
+
+    def test_carries_on(self):
+        src = ("x = 1.5  #: x : int\n"
+               "y = x  #: y : int\n"
+               "if y == 1:\n"
+               "    x = 'a'\n"
+               "    z = q\n"
+               "    print y\n"
+               "print 1 is 2\n")
+        mod = parse_source(src)
+        ds = diagnose_mod(mod)
+
+        self.assertEqual( [d.lineno for d in ds], [1, 4, 5] )
+        self.assertEqual( ds[2].message, "TypeUnspecifiedError: variable z "
+                                         "has unspecified type" )
+        self.assertFalse( check_mod(mod) )
+
+    def test_not_arrow(self):
+        mod = parse_source("#: f : int\n"
+                           "def f():\n"
+                           "    pass\n"
+                           "g = lambda: 1  #: g : int\n"
+                           "x = 1.5  #: x : int\n")
+
+        self.assertEqual( [(d.lineno, d.node) for d in diagnose_mod(mod)],
+                          [(2, "FunctionDef"), (4, "Lambda"), (5, "Num")] )
+        self.assertFalse( check_mod(mod) )
+
+    def test_multi_specified(self):
+        mod = parse_source("x = 1  #: x : int\n"
+                           "x = 2.5  #: x : float\n"
+                           "y = x  #: y : int\n")
+        ds = diagnose_mod(mod)
+
+        self.assertEqual( [(d.lineno, d.node) for d in ds],
+                          [(2, "TypeDec"), (3, "Name")] )
+        self.assertEqual( ds[0].message, "TypeMultiSpecifiedError" )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import sys
+import random
+import unittest
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+from env import Env, as_env
+from ptype import PType
+
+int_t = PType.int()
+float_t = PType.float()
+
+class Key(object):
+    """An identifier with a chosen hash, to force hash collisions."""
+
+    def __init__(self, name, h):
+        self.name = name
+        self.h = h
+
+    def __hash__(self):
+        return self.h
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return self.name < other.name
+
+    def __repr__(self):
+        return self.name
+
+class EnvTests(unittest.TestCase):
+
+    def test_extend(self):
+        env0 = Env()
+        env1 = env0.extend("x", int_t)
+        env2 = env1.extend_all([("y", float_t), ("x", float_t)])
+
+        self.assertEqual( len(env0), 0 )
+        self.assertFalse( "x" in env0 )
+        self.assertIs( env1["x"], int_t )
+        self.assertIs( env2["x"], float_t )
+        self.assertEqual( len(env2), 2 )
+        self.assertEqual( sorted(env2.items()), [("x", float_t),
+                                                 ("y", float_t)] )
+        self.assertRaises( KeyError, lambda: env1["y"] )
+        self.assertEqual( repr(env1), "{'x': int}" )
+
+        versions = set(e.version for e in [env0, env1, env2])
+        self.assertEqual( len(versions), 3 )
+
+    def test_as_env(self):
+        env = Env({"x": int_t})
+
+        self.assertIs( as_env(env), env )
+        self.assertEqual( as_env({"x": int_t}).items(), env.items() )
+
+    def test_against_dict(self):
+        rand = random.Random(0)
+        (env, d) = (Env(), {})
+        envs = []
+
+        for i in xrange(5000):
+            k = "v%d" % rand.randrange(2000)
+            t = PType.list(int_t) if i % 2 else int_t
+            env = env.extend(k, t)
+            d[k] = t
+            envs.append((env, dict(d)))
+
+        # Every earlier environment is unchanged by later extensions.
+        for (env, d) in envs[::250]:
+            self.assertEqual( len(env), len(d) )
+            self.assertEqual( sorted(env.items()), sorted(d.items()) )
+            for k in d:
+                self.assertIs( env[k], d[k] )
+
+    def test_collisions(self):
+        ks = [Key("k%d" % i, 7) for i in range(5)]
+        env = Env().extend_all((k, int_t) for k in ks)
+        env = env.extend(ks[2], float_t)
+
+        self.assertEqual( len(env), 5 )
+        self.assertIs( env[ks[2]], float_t )
+        self.assertIs( env[ks[4]], int_t )
+        self.assertFalse( Key("k9", 7) in env )
+
+
+if __name__ == '__main__':
+    unittest.main()
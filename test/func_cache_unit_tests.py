@@ -0,0 +1,163 @@
+import os
+import ast
+import sys
+import shutil
+import tempfile
+import unittest
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+from ast_extensions import TypeDec, TypeDecTable
+from check import check_mod, diagnose_mod
+from env import Env
+from errors import TypeMultiSpecifiedError
+from func_cache import FunctionCache
+from parse_file import parse_source
+from ptype import PType
+from logger import Logger
+
+import check
+import infer
+import parse_file
+
+check.log = infer.log = parse_file.log = Logger()
+
+int_t = PType.int()
+
+def function(src):
+    return ast.parse(src).body[0]
+
+class FingerprintTests(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = FunctionCache()
+        self.env = Env({"f": PType.from_str("int -> int"), "n": int_t})
+
+    def fingerprint(self, src, env=None):
+        return self.cache.fingerprint(function(src), env or self.env)
+
+    def test_position_independent(self):
+        self.assertEqual( self.fingerprint("def f(x):\n    return x + n\n"),
+                          self.fingerprint("\n\n\ndef f(x):\n"
+                                           "    return (x +   n)\n") )
+
+    def test_body(self):
+        self.assertNotEqual( self.fingerprint("def f(x):\n    return x\n"),
+                             self.fingerprint("def f(x):\n    return n\n") )
+
+    def test_environment(self):
+        src = "def f(x):\n    return x + n\n"
+        fp = self.fingerprint(src)
+
+        # Only the entries for identifiers the function mentions matter.
+        self.assertEqual( fp, self.fingerprint(src,
+                                               self.env.extend("m", int_t)) )
+        self.assertNotEqual( fp, self.fingerprint(
+            src, self.env.extend("n", PType.float())) )
+        self.assertNotEqual( fp, self.fingerprint(
+            src, self.env.extend("f", PType.from_str("int -> float"))) )
+
+    def test_table(self):
+        mod = ast.parse("def f(x):\n    y = x\n    return y\n")
+        tdecs = [TypeDec([ast.Name("y", ast.Store())], spec, 2)
+                 for spec in ["int", "float"]]
+        (f, env) = (mod.body[0], self.env)
+
+        # Declarations kept beside the function still change its fingerprint.
+        fps = [self.cache.fingerprint(f, env, TypeDecTable(mod, [tdec]))
+               for tdec in tdecs]
+        self.assertNotEqual( fps[0], fps[1] )
+        self.assertNotEqual( fps[0], self.cache.fingerprint(f, env) )
+        self.assertEqual( self.cache.fingerprint(f, env, TypeDecTable(mod, [])),
+                          self.cache.fingerprint(f, env) )
+
+    def test_nested_function(self):
+        src = "def f(x):\n    def g(y):\n        return y\n    return x\n"
+        fp = self.fingerprint(src, self.env.extend("g", self.env["f"]))
+
+        # A nested definition's type comes from the enclosing environment.
+        self.assertNotEqual( fp, self.fingerprint(
+            src, self.env.extend("g", PType.from_str("int -> str"))) )
+
+    def test_undeclared(self):
+        self.assertIs( self.fingerprint("def g(x):\n    return x\n"), None )
+        self.assertIs( self.cache.fingerprint(ast.parse("x = 1").body[0],
+                                              self.env), None )
+
+class CheckTests(unittest.TestCase):
+
+    src = ("n = 1  #: n : int\n"
+           "def f(x):  #: f : int -> int\n"
+           "    return x + n\n"
+           "def g(x):  #: g : int -> str\n"
+           "    return x\n")
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_successes_only(self):
+        cache = FunctionCache(self.path)
+        mod = parse_source(self.src)
+
+        self.assertEqual( [d.lineno for d in diagnose_mod(mod, cache)], [5] )
+        self.assertEqual( cache.stats(), {"size": 1, "hits": 0, "misses": 2} )
+
+        # The failing function is checked and reported again.
+        self.assertEqual( [d.lineno for d in diagnose_mod(mod, cache)], [5] )
+        self.assertEqual( cache.stats(), {"size": 1, "hits": 1, "misses": 3} )
+        self.assertFalse( check_mod(mod, cache) )
+
+    def test_nested_function(self):
+        src = ("#: g : %s\n"
+               "#: f : int -> int\n"
+               "def f(x):\n"
+               "    def g(y):\n"
+               "        return y\n"
+               "    return x\n")
+        cache = FunctionCache(self.path)
+
+        for (g_spec, result) in [("int -> int", True), ("int -> str", False)]:
+            mod = parse_source(src % g_spec)
+            self.assertEqual( check_mod(mod), result )
+            self.assertEqual( check_mod(mod, cache), result )
+
+    def test_declared_in_body(self):
+        src = ("#: f : int -> int\n"
+               "def f(x):\n"
+               "    #: m : float\n"
+               "    return x\n")
+        cache = FunctionCache(self.path)
+        self.assertTrue( check_mod(parse_source(src), cache) )
+
+        # Declaring m outside f now conflicts with the declaration in it,
+        # though m is only named by that declaration.
+        src = "#: m : int\nm = 1\n" + src
+        self.assertRaises( TypeMultiSpecifiedError, check_mod,
+                           parse_source(src) )
+        self.assertRaises( TypeMultiSpecifiedError, check_mod,
+                           parse_source(src), cache )
+
+    def test_saved(self):
+        cache = FunctionCache(self.path)
+        self.assertFalse( check_mod(parse_source(self.src), cache) )
+        cache.save()
+
+        # Fixing g only rechecks g.
+        src = self.src.replace("g : int -> str", "g : int -> int")
+
+        cache = FunctionCache(self.path)
+        self.assertTrue( check_mod(parse_source(src), cache) )
+        self.assertEqual( cache.stats(), {"size": 2, "hits": 1, "misses": 1} )
+
+        cache.save()
+        cache.save()
+        self.assertEqual( len(open(self.path).readlines()), 2 )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import ast
+import sys
+import unittest
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+import check
+import tracing
+from infer import infer_expr, infer_memo
+from env import Env
+from ptype import PType
+
+T = PType.from_str
+
+class InferMemoTests(unittest.TestCase):
+
+    def setUp(self):
+        check.clear_memos()
+        infer_memo.reset_stats()
+
+    def tearDown(self):
+        tracing.disable()
+
+    def test_tuple(self):
+        env = Env({"x": T("int"), "y": T("[float]")})
+        e = ast.parse("(x, y, (x,))").body[0].value
+
+        infer_memo.begin_run()
+        try:
+            self.assertIs( infer_expr(e, env), T("(int, [float], (int,))") )
+            self.assertEqual( (infer_memo.hits, infer_memo.misses), (0, 5) )
+            self.assertIs( infer_expr(e, env), T("(int, [float], (int,))") )
+            self.assertEqual( infer_memo.hits, 1 )
+
+            # A different environment is a different entry.
+            self.assertIs( infer_expr(e, env.extend("x", T("str"))),
+                           T("(str, [float], (str,))") )
+            self.assertIs( infer_expr(ast.parse("(x, [])").body[0].value,
+                                      env), None )
+        finally:
+            infer_memo.end_run()
+
+        # Outside a run, the table lasts for one call.
+        self.assertEqual( len(infer_memo), 0 )
+        self.assertIs( infer_expr(e, env), T("(int, [float], (int,))") )
+        self.assertEqual( len(infer_memo), 0 )
+
+    def test_subscript_chain(self):
+        depth = 100
+        t = T("int")
+        for i in range(depth):
+            t = PType.tuple([t, T("float")])
+
+        env = Env({"a": t})
+        e = ast.parse("a" + "[0]" * depth + " < 1.5").body[0].value
+
+        sink = tracing.ListSink()
+        tracing.enable(sink)
+
+        self.assertFalse( check.check_expr(e, T("bool"), env) )
+
+        # Ineqlty checks the chain as each of int, float, str and unicode, but
+        # each subexpression's type is inferred once.
+        inferred = [ev for ev in sink.events if ev.kind == "infer"]
+        self.assertEqual( len(inferred), depth )
+
+    def test_dict_env(self):
+        e = ast.parse("x").body[0].value
+
+        self.assertIs( infer_expr(e, {"x": T("int")}), T("int") )
+        self.assertEqual( len(infer_memo), 0 )
+
+
+if __name__ == '__main__':
+    unittest.main()
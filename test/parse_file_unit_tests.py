@@ -0,0 +1,99 @@
+import os
+import ast
+import sys
+import tempfile
+import unittest
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+from ast_extensions import TypeDec, TypeDecASTModule
+from check import check_mod
+from parse_file import (read_source, parse_source, parse_source_file,
+                        parse_type_decs, parse_type_decs_text)
+from ptype import PType
+from logger import Logger
+
+import check
+import infer
+import parse_file
+
+check.log = infer.log = parse_file.log = Logger()
+
+src = ("#: x : int\n"
+       "x = 1\n"
+       "#: y : float  # a comment\n"
+       "y = 1.5\n")
+
+class SourceTests(unittest.TestCase):
+
+    def setUp(self):
+        (fd, self.path) = tempfile.mkstemp(suffix=".py")
+        with os.fdopen(fd, 'wb') as f:
+            f.write(src)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_read(self):
+        self.assertEqual( read_source(self.path), src )
+
+    def test_type_decs(self):
+        tdecs = parse_type_decs_text(src)
+
+        self.assertEqual( [(d.lineno, d.targets[0].id, d.t) for d in tdecs],
+                          [(1, "x", PType.int()), (3, "y", PType.float())] )
+        self.assertEqual( [d.lineno for d in parse_type_decs(self.path)],
+                          [1, 3] )
+
+    def test_columns(self):
+        [d] = parse_type_decs_text("x = [1]  # list #: x : [int] # note\n")
+
+        self.assertEqual( (d.lineno, d.col_offset), (1, 16) )
+        self.assertEqual( (d.targets[0].id, d.targets[0].col_offset),
+                          ("x", 19) )
+        self.assertEqual( d.t, PType.list(PType.int()) )
+
+    def test_comments_only(self):
+        text = ("s = '#: a : int'\n"
+                "'''\n"
+                "#: b : int\n"
+                "'''\n"
+                "t = \"\\\"#: c : int\"  #: d : int #: e : float\n")
+        tdecs = parse_type_decs_text(text)
+
+        self.assertEqual( [(d.lineno, d.targets[0].id) for d in tdecs],
+                          [(5, "e")] )
+        self.assertEqual( parse_type_decs_text("x = 1\n"), [] )
+
+    def test_parse(self):
+        for mod in [parse_source(src), parse_source_file(self.path)]:
+            self.assertEqual( [s.__class__ for s in mod.tree.body],
+                              [ast.Assign] * 2 )
+            self.assertEqual( [s.__class__ for s in
+                               mod.table.merged(mod.tree.body)],
+                              [TypeDec, ast.Assign] * 2 )
+            self.assertTrue( check_mod(mod) )
+
+    def test_views(self):
+        mod = parse_source(src)
+        other = TypeDecASTModule(mod.tree, parse_type_decs_text(
+            src.replace("y : float", "y : int")))
+
+        # Both views check the one tree, each against its own declarations.
+        self.assertTrue( check_mod(mod) )
+        self.assertFalse( check_mod(other) )
+        self.assertTrue( check_mod(mod) )
+        self.assertEqual( len(mod.tree.body), 2 )
+
+    def test_no_logging(self):
+        saved = (parse_file.log, check.log, infer.log)
+        parse_file.log = check.log = infer.log = None
+        try:
+            self.assertTrue( check_mod(parse_source(src)) )
+        finally:
+            (parse_file.log, check.log, infer.log) = saved
+
+
+if __name__ == '__main__':
+    unittest.main()
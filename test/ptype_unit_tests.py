@@ -1,12 +1,19 @@
 import sys
+import pickle
+import subprocess
 import unittest
 from lepl import sexpr_to_tree
 
 # Include src in the Python search path
 sys.path.insert(0, '../src')
 
-from ptype import (PType, TypeSpecParser, better_sexpr_to_tree, Lst, Stt, Tup,
-                   Mpp, Arr)
+import ptype
+from ptype import PType, TypeSpecParser, TupleSlice
+from util import LRUCache
+from ptype_codec import dumps, loads, dumps_env, loads_env
+from lepl_parser import (LEPLTypeSpecParser, better_sexpr_to_tree, from_type_ast,
+                         Lst, Tup, Arr)
+from errors import TypeIncorrectlySpecifiedError, TypeSerializationError
 
 int_t = PType.int()
 float_t = PType.float()
@@ -42,15 +49,7 @@ class PTypeTests(unittest.TestCase):
         true = self.assertTrue
         true( PType.from_str("[int]").is_list() )
         true( PType.from_str("[float]").is_list() )
-        true( PType.from_str("[{float:str}]").is_list() )
-
-    def test_is_set(self):
-        true = self.assertTrue
-        true( PType.from_str("{bool}").is_set() )
-        true( PType.from_str("{unit}").is_set() )
-        true( PType.from_str("{(int, bool, float)}").is_set() )
-        true( PType.from_str("{ int -> bool }").is_set() )
-        true( PType.from_str("{{str: bool}}").is_set() )
+        true( PType.from_str("[(float, str)]").is_list() )
 
     def test_is_tuple(self):
         true = self.assertTrue
@@ -58,19 +57,12 @@ class PTypeTests(unittest.TestCase):
         true( PType.from_str("(bool,)").is_tuple() )
         true( PType.from_str("(bool,float,int,bool)").is_tuple() )
         true( PType.from_str("([int],[bool])").is_tuple() )
-        true( PType.from_str("({int:float},{float:int})").is_tuple() )
-
-    def test_is_map(self):
-        true = self.assertTrue
-        true( PType.from_str("{int:float}").is_map() )
-        true( PType.from_str("{float -> str:int}").is_map() )
-        true( PType.from_str("{int:unicode}").is_map() )
-        true( PType.from_str("{(int,int):float}").is_map() )
+        true( PType.from_str("(int -> float,[float])").is_tuple() )
 
     def test_is_arrow(self):
         true = self.assertTrue
         true( PType.from_str("int -> float").is_arrow() )
-        true( PType.from_str("unicode -> {int:float}").is_arrow() )
+        true( PType.from_str("unicode -> [(int, float)]").is_arrow() )
         true( PType.from_str("unicode -> str -> int").is_arrow() )
         true( PType.from_str("(unicode -> str) -> int").is_arrow() )
 
@@ -81,6 +73,15 @@ class PTypeTests(unittest.TestCase):
         true( PType.from_str("'Yothere").is_var() )
         true( PType.from_str("'hiB9").is_var() )
 
+    def test_var_whitespace(self):
+        # Only exact names take the single-token shortcut; others are parsed.
+        alpha = PType.from_str("'a")
+
+        self.assertIs( PType.from_str("'a\n"), alpha )
+        self.assertIs( PType.from_str(" 'a "), alpha )
+        self.assertRaises( TypeIncorrectlySpecifiedError, PType.from_str,
+                           "'a\nb" )
+
     def test_free_vars(self):
         equal = self.assertEqual
 
@@ -91,26 +92,210 @@ class PTypeTests(unittest.TestCase):
         equal( PType.from_str("'a").free_type_vars(), {alpha} )
         equal( PType.from_str("'a -> 'a").free_type_vars(), {alpha} )
         equal( PType.from_str("'a -> 'b").free_type_vars(), {alpha, beta} )
-        equal( PType.from_str("{'g : ('a, int)}").free_type_vars(), {alpha, gamma} )
+        equal( PType.from_str("['g] -> ('a, int)").free_type_vars(),
+               {alpha, gamma} )
+
+    def test_interning(self):
+        same = self.assertIs
+
+        alpha = PType.var("'a")
+
+        same( PType.from_str("[int]"), PType.list(int_t) )
+        same( PType.from_str("(int, [str])"),
+              PType.tuple([int_t, PType.list(str_t)]) )
+        same( PType.from_str("'a -> 'a"), PType.arrow(alpha, alpha) )
+        same( PType.from_str("'a -> 'a").quantify(),
+              PType.univ(alpha, PType.arrow(alpha, alpha)) )
+        same( PType.from_str("(int, float, bool)").tuple_slice(1).materialize(),
+              PType.from_str("(float, bool)") )
+
+        self.assertEqual( hash(PType.from_str("([int], 'b)")),
+                          hash(PType.tuple([PType.list(int_t),
+                                            PType.var("'b")])) )
+        self.assertNotEqual( PType.from_str("[int]"), PType.from_str("[float]") )
+
+    def test_hash_spread(self):
+        # Nested types must not collapse onto a few hash values, or interning
+        # them degrades to linear probing.
+        hashes = set()
+        t = int_t
+        for i in range(1000):
+            t = PType.arrow(PType.list(t), t)
+            hashes.update([hash(t), hash(t.dom)])
+        self.assertEqual( len(hashes), 2000 )
+
+    def test_immutable(self):
+        t = PType.from_str("(int, [str]) -> 'a")
+
+        self.assertFalse( hasattr(t, '__dict__') )
+        self.assertEqual( type(t.dom.elts), tuple )
+        self.assertRaises( AttributeError, setattr, t, 'tag', PType.INT )
+        self.assertRaises( AttributeError, setattr, t, 'ran', int_t )
+        self.assertRaises( AttributeError, getattr, t, 'elts' )
+
+    def test_spec_cache(self):
+        equal = self.assertEqual
+
+        cache = ptype.spec_cache
+        cache.clear()
+        cache.reset_stats()
+
+        t = PType.from_str("(int, float) -> bool")
+        self.assertIs( PType.from_str("(int,float)->bool"), t )
+        self.assertIs( PType.from_str("  ( int , float )  ->  bool "), t )
+        PType.from_str("[int]")
+
+        equal( (cache.hits, cache.misses, len(cache)), (2, 2, 2) )
+
+        # Whitespace between words is significant.
+        self.assertRaises( TypeIncorrectlySpecifiedError,
+                           PType.from_str, "in t" )
+
+    def test_single_token_specs(self):
+        cache = ptype.spec_cache
+        misses = cache.misses
+
+        self.assertIs( PType.from_str("unicode"), unicode_t )
+        self.assertIs( PType.from_str("'a1"), PType.var("'a1") )
+        self.assertEqual( cache.misses, misses )
+
+    def test_no_lepl_import(self):
+        # Pyty itself should never need the LEPL reference grammar.
+        code = ("import sys; sys.path.insert(0, '../src'); "
+                "import check, parse_file; "
+                "sys.exit('lepl' in sys.modules)")
+        self.assertEqual( subprocess.call([sys.executable, "-c", code]), 0 )
+
+    def test_lru_cache(self):
+        equal = self.assertEqual
+
+        cache = LRUCache(2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        equal( cache.get("a"), 1 )
+        cache.put("c", 3)
+        equal( cache.get("b"), None )
+        equal( cache.get("c"), 3 )
+
+        cache.resize(1)
+        equal( cache.get("a"), None )
+        equal( cache.stats(), {"capacity": 1, "size": 1, "hits": 2,
+                               "misses": 2, "evictions": 2} )
+
+    def test_quantify_cached(self):
+        same = self.assertIs
+
+        t = PType.from_str("('b, int -> 'a) -> ['a]")
+        alpha, beta = PType.var("'a"), PType.var("'b")
+
+        self.assertEqual( t.free_type_vars(), frozenset([alpha, beta]) )
+        same( t.free_type_vars(), t.free_type_vars() )
+        same( t.quantify(), PType.univ(alpha, PType.univ(beta, t)) )
+        same( t.quantify(), t.quantify() )
+        same( int_t.quantify(), int_t )
+
+    def test_tuple_slice(self):
+        equal = self.assertEqual
+
+        t = PType.tuple([PType.list(int_t)] * 3 + [str_t, PType.var("'a")])
+        u = t.tuple_slice(1, 4)
+
+        self.assertIs( u.__class__, TupleSlice )
+        equal( u, PType.from_str("([int], [int], str)") )
+        equal( PType.from_str("([int], [int], str)"), u )
+        equal( hash(u), hash(PType.from_str("([int], [int], str)")) )
+        self.assertIs( u.materialize(), PType.from_str("([int], [int], str)") )
+        equal( str(u), "([int], [int], str)" )
+        equal( u.tuple_len(), 3 )
+        equal( u.elts[-1], str_t )
+        self.assertNotEqual( u, t.tuple_slice(0, 3) )
+
+        # Slices of slices, negative and empty bounds, and steps.
+        equal( u.tuple_slice(1), PType.from_str("([int], str)") )
+        equal( t.tuple_slice(-2), PType.from_str("(str, 'a)") )
+        equal( t.tuple_slice(3, 1), PType.tuple([]) )
+        equal( t.tuple_slice(0, 5, 2), PType.from_str("([int], [int], 'a)") )
+        self.assertIs( t.tuple_slice(0), t )
+        equal( t.tuple_slice(3).free_type_vars(), frozenset([PType.var("'a")]) )
+
+        # Types built from slices never hold on to them.
+        self.assertIs( PType.list(u).elt, u.materialize() )
+        self.assertIs( PType.tuple([u, u]).elts[1], u.materialize() )
+        equal( {u: 1}.get(u.materialize()), 1 )
+
+    def test_wide_tuple_slices(self):
+        t = PType.tuple([PType.var("'a%d" % i) for i in range(1000)])
+        slices = [t.tuple_slice(0, m) for m in range(1000)]
+        rests = [t.tuple_slice(m) for m in range(1000)]
+
+        self.assertEqual( len(set(hash(u) for u in slices + rests)), 2000 )
+        self.assertEqual( slices[500], PType.tuple(t.elts[:500]) )
+        self.assertEqual( rests[998], PType.tuple(t.elts[998:]) )
 
     def test_quantify(self):
         equal = self.assertEqual
         equal( str(PType.from_str("'a").quantify()), "V'a.'a" )
         equal( str(PType.from_str("'a -> 'a").quantify()), "V'a.'a -> 'a" )
         equal( str(PType.from_str("'a -> 'b").quantify()), "V'a.V'b.'a -> 'b" )
-        equal( str(PType.from_str("{'g : ('a, int)}").quantify()),
-               "V'a.V'g.{'g: ('a, int)}" )
+        equal( str(PType.from_str("['g] -> ('a, int)").quantify()),
+               "V'a.V'g.['g] -> ('a, int)" )
+
+class PTypeCodecTests(unittest.TestCase):
+
+    specs = ["int", "unit", "'a", "[str]", "()", "(bool,)",
+             "(int, [float], 'x -> 'y)", "((int,), unicode) -> [['a]]"]
+
+    def test_round_trip(self):
+        for spec in self.specs:
+            t = PType.from_str(spec)
+            self.assertIs( loads(dumps(t)), t )
+            self.assertIs( loads(dumps(t.quantify())), t.quantify() )
+
+    def test_shared_subterms(self):
+        big = PType.from_str("(int, [float], 'x -> 'y, (str, bool))")
+        one = len(dumps(PType.tuple([big])))
+        many = len(dumps(PType.tuple([big] * 100)))
+
+        # Each extra reference to `big` only costs a one-byte index.
+        self.assertEqual( many - one, 99 )
+
+    def test_deep(self):
+        t = int_t
+        for i in range(5000):
+            t = PType.arrow(PType.list(t), t)
+        self.assertIs( loads(dumps(t)), t )
+
+    def test_env(self):
+        env = {"x": int_t, "f": PType.from_str("'a -> 'a").quantify(),
+               "ys": PType.from_str("[(int, str)]")}
+        self.assertEqual( loads_env(dumps_env(env)), env )
+        self.assertEqual( loads_env(dumps_env({})), {} )
+
+    def test_pickle(self):
+        env = {"f": PType.from_str("(int, [str]) -> 'a")}
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertIs( pickle.loads(pickle.dumps(env, protocol))["f"],
+                           env["f"] )
+
+    def test_bad_data(self):
+        data = dumps(PType.from_str("[int] -> str"))
+
+        for bad in ["", "XX" + data[2:], data[:-1], data + "\0",
+                    data[:2] + "\x09" + data[3:], dumps_env({})]:
+            self.assertRaises( TypeSerializationError, loads, bad )
 
 class TypeSpecTests(unittest.TestCase):
 
     def spec_has_repr(self, spec, repr):
         """
         Asserts that `spec`, a string representing a PType, has the structure
-        specified by `repr`.
+        specified by `repr` under the reference LEPL grammar, and that the
+        hand-written parser produces the same type.
         """
 
-        self.assertEqual(TypeSpecParser.print_parse(spec),
+        self.assertEqual(LEPLTypeSpecParser.print_parse(spec),
                          better_sexpr_to_tree(repr))
+        self.assertIs(TypeSpecParser.parse(spec), from_type_ast(repr))
 
 
     def test_parse_tree(self):
@@ -178,18 +363,17 @@ class TypeSpecTests(unittest.TestCase):
                         self.spec_has_repr("(%s, %s, %s, %s,)" % (t0, t1, t2, t3),
                                            Tup([t0, t1, t2, t3]))
 
-    def test_map(self):
-
-        for t0 in base_ts.keys():
+    def test_bad_specs(self):
 
-            for t1 in base_ts.keys():
+        bad = ["", "int int", "[int", "[int]]", "(int,,)", "(,)", "int ->",
+               "-> int", "intx", "'", "'a'b", "(int float)", "[int, float]",
+               "int -> -> float", "5", "{int: float}"]
 
-                self.spec_has_repr("{%s: %s}" % (t0, t1), Mpp([t0, t1]))
-                self.spec_has_repr("{%s :%s}" % (t0, t1), Mpp([t0, t1]))
-                self.spec_has_repr("{%s : %s}" % (t0, t1), Mpp([t0, t1]))
-                self.spec_has_repr("{  %s:%s}" % (t0, t1), Mpp([t0, t1]))
-                self.spec_has_repr("{ %s:%s  }" % (t0, t1), Mpp([t0, t1]))
-                self.spec_has_repr("{  %s :%s}" % (t0, t1), Mpp([t0, t1]))
+        for spec in bad:
+            self.assertRaises(TypeIncorrectlySpecifiedError,
+                              TypeSpecParser.parse, spec)
+            self.assertRaises(TypeIncorrectlySpecifiedError,
+                              LEPLTypeSpecParser.parse, spec)
 
     def test_arr(self):
 
@@ -213,12 +397,9 @@ class TypeSpecTests(unittest.TestCase):
             for t1 in base_ts.keys():
 
                 rep("[(%s, %s)]" % (t0, t1), Lst([Tup([t0, t1])]))
-                rep("[{%s: %s}]" % (t0, t1), Lst([Mpp([t0, t1])]))
                 rep("[%s -> %s]" % (t0, t1), Lst([Arr([t0, t1])]))
                 rep("([%s], [%s])" % (t0, t1), Tup([Lst([t0]), Lst([t1])]))
                 rep("((%s,), (%s,))" % (t0, t1), Tup([Tup([t0]), Tup([t1])]))
-                rep("{[%s]: [%s]}" % (t0, t1), Mpp([Lst([t0]), Lst([t1])]))
-                rep("{(%s,): (%s,)}" % (t0, t1), Mpp([Tup([t0]), Tup([t1])]))
                 rep("[%s] -> [%s]" % (t0, t1), Arr([Lst([t0]), Lst([t1])]))
                 rep("(%s,) -> (%s,)" % (t0, t1), Arr([Tup([t0]), Tup([t1])]))
 
@@ -0,0 +1,138 @@
+spec mode: mod
+
+----pass----
+
+---
+#: ident: 'a -> 'a
+def ident(x):
+    return x
+
+#: y: int
+y = ident(5)
+---
+#: ident: 'a -> 'a
+def ident(x):
+    return x
+
+#: y: int
+y = ident(5)
+#: z: str
+z = ident("hi")
+---
+#: ident: 'a -> 'a
+def ident(x):
+    return x
+
+ident(5)
+---
+#: first: ('a, 'b) -> 'a
+def first(x, y):
+    return x
+
+#: f: float
+f = first(1.5, "a")
+---
+#: second: ('a, 'b) -> 'b
+def second(x, y):
+    return y
+
+#: n: int
+n = second(1.5, 3)
+---
+#: pair: ('a, 'b) -> ('b, 'a)
+def pair(x, y):
+    return (y, x)
+
+#: p: (str, int)
+p = pair(1, "b")
+---
+#: wrap: 'a -> ['a]
+def wrap(x):
+    return [x]
+
+#: xs: [int]
+xs = wrap(4)
+---
+#: wrap: 'a -> ['a]
+def wrap(x):
+    return [x]
+
+#: xs: [[float]]
+xs = wrap(wrap(4.0))
+---
+#: head: ['a] -> 'a
+def head(xs):
+    return xs[0]
+
+#: xs: [int]
+xs = [1, 2, 3]
+#: h: int
+h = head(xs)
+---
+#: nothing: unit -> ['a]
+def nothing():
+    return []
+
+#: xs: [int]
+xs = nothing()
+---
+#: ident: 'a -> 'a
+def ident(x):
+    return x
+
+#: apply: ('a -> 'b, 'a) -> 'b
+def apply(f, x):
+    return f(x)
+
+#: y: int
+y = ident(3)
+
+----fail----
+
+---
+#: ident: 'a -> 'a
+def ident(x):
+    return x
+
+#: y: int
+y = ident(5.0)
+---
+#: ident: 'a -> 'a
+def ident(x):
+    return x
+
+#: y: int
+y = ident("hi")
+---
+#: first: ('a, 'b) -> 'a
+def first(x, y):
+    return x
+
+#: f: float
+f = first(1, 1.5)
+---
+#: wrap: 'a -> ['a]
+def wrap(x):
+    return [x]
+
+#: x: int
+x = wrap(4)
+---
+#: ident: 'a -> 'a
+def ident(x):
+    return 5
+---
+#: ident: 'a -> 'a
+def ident(x):
+    return x
+
+#: y: int
+y = ident()
+---
+#: nothing: unit -> 'a
+def nothing():
+    return 5
+---
+#: const: 'a -> 'b -> 'a
+def const(x):
+    return x
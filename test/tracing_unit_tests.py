@@ -0,0 +1,81 @@
+import ast
+import sys
+import logging
+import unittest
+
+# Include src in the Python search path.
+sys.path.insert(0, '../src')
+
+import tracing
+from check import check_expr
+from infer import infer_expr
+from env import Env
+from ptype import PType
+
+int_t = PType.int()
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+class TracingTests(unittest.TestCase):
+
+    def tearDown(self):
+        tracing.disable()
+
+    def test_events(self):
+        sink = tracing.ListSink()
+        tracing.enable(sink)
+
+        e = ast.parse("x + {}").body[0].value
+        self.assertFalse( check_expr(e, int_t, Env({"x": int_t})) )
+
+        kinds = [(ev.kind, ev.node, ev.rule, ev.result, ev.depth)
+                 for ev in sink.events]
+        self.assertEqual( kinds,
+            [("expr", "Name", "_check_Name_expr", True, 1),
+             ("expr", "Dict", None, False, 1),
+             ("expr", "BinOp", "_check_BinOp_expr", False, 0)] )
+
+        self.assertTrue( all(ev.lineno == 1 and ev.type is int_t
+                             for ev in sink.events) )
+        self.assertTrue( all(ev.duration >= 0 for ev in sink.events) )
+
+    def test_infer_events(self):
+        sink = tracing.ListSink()
+        tracing.enable(sink)
+
+        self.assertIs( infer_expr(ast.parse("(1, 2.0)").body[0].value, Env()),
+                       PType.from_str("(int, float)") )
+        self.assertEqual( sink.events[-1].kind, "infer" )
+        self.assertIs( sink.events[-1].result, PType.from_str("(int, float)") )
+
+    def test_disabled(self):
+        sink = tracing.ListSink()
+        tracing.enable(sink)
+        tracing.disable()
+
+        self.assertTrue( check_expr(ast.Num(1), int_t, Env()) )
+        self.assertEqual( sink.events, [] )
+
+    def test_logging_sink(self):
+        logger = logging.getLogger("pyty.trace.test")
+        logger.propagate = False
+        handler = ListHandler()
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+
+        tracing.enable(tracing.LoggingSink(logger))
+        check_expr(ast.parse("[1]").body[0].value, PType.list(int_t), Env())
+
+        self.assertEqual( len(handler.messages), 2 )
+        self.assertTrue( handler.messages[0].startswith("  Num expr as int") )
+        self.assertTrue( handler.messages[1].startswith("List expr as [int]") )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import sys
+import unittest
+
+# Include src in the Python search path
+sys.path.insert(0, '../src')
+
+from ptype import PType
+from unify import Substitution
+
+int_t = PType.int()
+float_t = PType.float()
+
+T = PType.from_str
+
+class UnifyTests(unittest.TestCase):
+
+    def test_instantiate(self):
+        s = Substitution()
+        t = s.instantiate(T("('a, 'b) -> 'a").quantify())
+
+        self.assertTrue( t.is_arrow() )
+        self.assertEqual( t.free_type_vars(), s.flexible )
+        self.assertEqual( len(s.flexible), 2 )
+
+        # Unquantified variables stay as they are.
+        self.assertIs( s.instantiate(T("'a -> 'a")), T("'a -> 'a") )
+
+    def test_unify(self):
+        s = Substitution()
+        t = s.instantiate(T("('a, ['b]) -> 'a").quantify())
+
+        self.assertTrue( s.unify(t, T("(int, [float]) -> int")) )
+        self.assertIs( s.apply(t), T("(int, [float]) -> int") )
+        self.assertFalse( s.has_flexible(t) )
+
+    def test_mismatch(self):
+        s = Substitution()
+        t = s.instantiate(T("('a, 'a)").quantify())
+
+        self.assertFalse( s.unify(t, T("(int, float)")) )
+        self.assertFalse( Substitution().unify(T("[int]"), T("(int,)")) )
+        self.assertFalse( Substitution().unify(T("(int,)"), T("(int, int)")) )
+
+    def test_rigid(self):
+        s = Substitution()
+
+        # Variables that weren't instantiated only unify with themselves...
+        self.assertFalse( s.unify(T("'a"), int_t) )
+        self.assertTrue( s.unify(T("'a -> int"), T("'a -> int")) )
+
+        # ...or with flexible variables.
+        t = s.instantiate(T("'b").quantify())
+        self.assertTrue( s.unify(t, T("'a")) )
+        self.assertIs( s.apply(t), T("'a") )
+
+    def test_occurs(self):
+        s = Substitution()
+        t = s.instantiate(T("'a").quantify())
+
+        self.assertFalse( s.unify(t, PType.list(t)) )
+
+        s = Substitution()
+        (u, v) = s.instantiate(T("('a, 'b)").quantify()).elts
+
+        self.assertTrue( s.unify(u, PType.list(v)) )
+        self.assertFalse( s.unify(v, PType.tuple([int_t, u])) )
+
+    def test_long_chain(self):
+        s = Substitution()
+        vs = s.instantiate(T("(%s)" % ", ".join("'a%d" % i
+                                               for i in range(2000))
+                              ).quantify()).elts
+
+        for (v0, v1) in zip(vs, vs[1:]):
+            self.assertTrue( s.unify(v0, v1) )
+        self.assertTrue( s.unify(vs[-1], float_t) )
+
+        self.assertTrue( all(s.apply(v) is float_t for v in vs) )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,11 +10,12 @@ sys.path.insert(0, '../src')
 
 from ast_extensions import TypeDecASTModule
 from check import (check_expr, check_mod, expr_template, call_function)
-from parse_file import parse_type_decs
+from parse_file import read_source, parse_type_decs_text
 from ptype import PType
 from errors import TypeUnspecifiedError, TypeIncorrectlySpecifiedError
 from settings import (TEST_CODE_SUBDIR, DEBUG_SUBJECT_FILE, DEBUG_UNTYPED_AST,
-                      DEBUG_TYPED_AST, DEBUG_TYPEDECS)
+                      DEBUG_TYPED_AST, DEBUG_TYPEDECS, DEBUG_TYPECHECK,
+                      FILE_DEBUG)
 from logger import Logger, announce_file
 from util import log_center
 
@@ -24,6 +25,7 @@ import ast_extensions
 import parse_file
 import check
 import infer
+import tracing
 
 """
 This is just the core of the unit testing file. generate_tests.py must be run
@@ -71,14 +73,16 @@ class PytyTests(unittest.TestCase):
                 " as expecting: " + expected)
 
     def _parse_and_check_mod(self, filename):
-        with open(filename, 'r') as f:
-            text = f.read()
+        text = read_source(filename)
 
         debug_file = TEST_CODE_SUBDIR + DEBUG_SUBJECT_FILE
         if filename == debug_file:
             log.enter_debug_file()
+            if FILE_DEBUG and DEBUG_TYPECHECK:
+                tracing.enable(tracing.LoggingSink())
         else:
             log.exit_debug_file()
+            tracing.disable()
 
         log.debug("--- v File : " + filename + " v ---\n" + text + "--- ^ File text ^ ---")
 
@@ -87,7 +91,7 @@ class PytyTests(unittest.TestCase):
         log.debug((log_center("v Untyped AST v") + str(untyped_ast) +
                    log_center("^ Untyped AST ^")), DEBUG_UNTYPED_AST)
 
-        typedecs = parse_type_decs(filename)
+        typedecs = parse_type_decs_text(text)
 
         log.debug((log_center("v TypeDecs v") + str(typedecs) +
                    log_center("^ TypeDecs ^")), DEBUG_TYPEDECS)
@@ -97,7 +101,7 @@ class PytyTests(unittest.TestCase):
         log.debug((log_center("v TypedAST v") + str(typed_ast) +
                    log_center("^ TypedAST ^")), DEBUG_TYPED_AST)
 
-        return check_mod(typed_ast.tree)
+        return check_mod(typed_ast)
 
     def _check_mod(self, filename):
         """Typechecks the contents of file C{filename} as a